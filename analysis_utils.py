@@ -8,13 +8,33 @@ LOGBOOK: 82, line 263 extraneous trigger
 import eeg_eyetracking_parser as eet
 from eeg_eyetracking_parser import _eeg_preprocessing as eep
 import mne; mne.set_log_level(False)
-from mne.time_frequency import tfr_morlet
-from datamatrix import DataMatrix, convert as cnv, operations as ops, \
-    series as srs, functional as fnc, io
+from mne.time_frequency import morlet
+from mne.annotations import _sync_onset
+from mne.utils import _time_mask
+from mne.channels.layout import _find_topomap_coords
+from mne.viz import topomap as mne_topomap
+from datamatrix import DataMatrix, MultiDimensionalColumn, SeriesColumn, \
+    FloatColumn, IntColumn, convert as cnv, operations as ops, \
+    series as srs, io, cfg
+from datamatrix._datamatrix._seriescolumn import _SeriesColumn
+from datamatrix._datamatrix._multidimensionalcolumn import \
+    _MultiDimensionalColumn
 import numpy as np
-from scipy.stats import linregress
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.decomposition import PCA
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import shutil
+import fnmatch
+import functools
+import warnings
+import logging
+import time_series_test as tst
+from scipy import fft
+from scipy.stats import norm, t as t_dist, beta as beta_dist
+import patsy
 import matplotlib as mpl
 from matplotlib import pyplot as plt
 
@@ -46,6 +66,61 @@ STIMULUS_TRIGGER_ADJUSTMENT = 19
 FREQS = np.arange(4, 30, 1)
 MORLET_MARGIN = .5
 FIGSIZE = 6, 6
+# The sessions can be preprocessed in parallel by get_merged_data(). The
+# memory limit is specified in bytes per process, or None for no limit. The
+# limit is not supported on Windows.
+N_PROCESSES = 1
+MAX_MEMORY_PER_PROCESS = None
+# Preprocessed sessions are cached separately, so that only sessions for which
+# the raw data or the preprocessing has changed are processed again. Increase
+# the preprocessing version whenever get_subject_data() changes in a way that
+# affects its output. The checkpoints are stored in the checkpoints folder of
+# the working directory. This is the same location as before: the checkpoint
+# was memoized with key ../checkpoints/{CHECKPOINT}.dm, which is relative to
+# the .memoize folder.
+CHECKPOINT_FOLDER = Path('checkpoints')
+SESSION_CACHE_FOLDER = CHECKPOINT_FOLDER / 'sessions'
+PREPROCESSING_VERSION = 5
+# Time-frequency power is z-scored separately for each frequency, either
+# within each session ('session') or across all sessions ('merged').
+TFR_Z_SCOPE = 'session'
+# Time-frequency power is cached by the content of the EOG data and the
+# parameters of the analysis, so that it isn't computed again when a session
+# is processed again for another reason. Cache files that are not used when
+# sessions are processed are removed afterwards.
+TFR_CACHE_FOLDER = CHECKPOINT_FOLDER / 'tfr'
+# Channel names, types, and positions, and the sampling rate, are stored
+# alongside the merged data by get_merged_data(), so that analyses don't need
+# to read the raw data only to get this information
+CHANNEL_INFO_PATH = CHECKPOINT_FOLDER / f'{CHECKPOINT}-channels.json'
+EEG_PREPROCESSING = [
+    'drop_unused_channels',
+    'rereference_channels',
+    'annotate_emg',
+    'create_eog_channels',
+    'set_montage',
+    'band_pass_filter',
+    'autodetect_bad_channels',
+    'interpolate_bads'
+]
+# The number of epochs that are read from the raw data at once
+EPOCH_CHUNK_SIZE = 100
+# Series and multidimensional columns can be stored with single precision to
+# halve the size of the checkpoint and the memory that is used by the
+# analyses. This is opt-in; see analyze_precision.py for the effect on the
+# derived measures. The patterns indicate which columns are affected.
+PRECISION = 'float64'
+FLOAT32_COLUMNS = ['erp*', 'eog*', 'gaze_*', 'pupil']
+# The columns that filter_dm() depends on. These are always loaded when
+# get_merged_data() is called with a selection of columns.
+FILTER_COLUMNS = ['blink_latency', 'field', 'training', 'z_pupil',
+                  'z_pupil_slope', 'mean_pupil']
+# Per-trial summaries of eye movements (see gaze_kinematics()) can be computed
+# while the gaze data of a session is in memory, and are then stored as
+# columns of the merged data.
+GAZE_KINEMATICS = True
+GAZE_KINEMATICS_COLUMNS = ['mean_gaze_vel', 'mean_gaze_acc',
+                           'microsaccade_count', 'drift_amplitude']
 
 Z_THRESHOLD = 3
 # Maps [-1, 1] intensity to cd/m2
@@ -66,6 +141,7 @@ INTENSITY_ORD = {
     .59: 4,
     1: 5
 }
+logger = logging.getLogger(__name__)
 mne.io.pick._PICK_TYPES_DATA_DICT['misc'] = True
 FOLDER_SVG = Path('svg')
 if not FOLDER_SVG.exists():
@@ -73,6 +149,25 @@ if not FOLDER_SVG.exists():
 FOLDER_TOPOMAPS = FOLDER_SVG / 'topomaps'
 if not FOLDER_TOPOMAPS.exists():
     FOLDER_TOPOMAPS.mkdir()
+FOLDER_RESULTS = Path('results')
+# Completed permutations of permutation_test() are stored here, so that an
+# interrupted test resumes where it stopped
+PERMUTATION_FOLDER = CHECKPOINT_FOLDER / 'permutations'
+PERMUTATION_ITERATIONS = 1000
+# The number of permutations that are fit together in a single batch
+PERMUTATION_BATCH_SIZE = 50
+# The p-value thresholds that are distinguished by annotate_clusters(). In
+# sequential mode, permutation_test() stops when the p-values of all clusters
+# are known relative to these thresholds.
+CLUSTER_P_THRESHOLDS = .05, .01, .001
+# The fractions of the permutations after which a test in sequential mode can
+# stop early. The error rate is divided over these looks, so there should be
+# only a few of them.
+SEQUENTIAL_LOOKS = .1, .25, .5
+# The candidate values of the random-intercept variance (relative to the
+# residual variance) that are evaluated before fast_lmer_series() refines the
+# estimate for each sample
+LAMBDA_GRID = np.r_[0, np.logspace(-6, 6, 61)]
 
 
 # Monkeypatch the preprocessor to avoid EOGs from being subtracted and instead
@@ -109,140 +204,943 @@ def area_to_mm(au):
     return -0.9904 + 0.1275 * au ** .5
 
 
-def z_by_freq(col):
+def linregress_rows(x, y):
+    """Performs a linear regression of each row of y on x. This is a
+    vectorized version of scipy.stats.linregress(). As for linregress(), rows
+    that contain nan values result in nan values, and the correlation is 0 for
+    rows without variance.
+    
+    Parameters
+    ----------
+    x: array
+        A one-dimensional array of length N.
+    y: array
+        A two-dimensional array with the shape (rows, N).
+    
+    Returns
+    -------
+    tuple
+        A (slope, intercept, rvalue) tuple of one-dimensional arrays.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xmean = x.mean()
+    ymean = y.mean(axis=1)
+    xm = x - xmean
+    ssxm = xm @ xm
+    ssym = ((y - ymean[:, None]) ** 2).sum(axis=1)
+    ssxym = (y - ymean[:, None]) @ xm
+    slope = ssxym / ssxm
+    intercept = ymean - slope * xmean
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rvalue = ssxym / np.sqrt(ssxm * ssym)
+    rvalue[ssym == 0] = 0
+    rvalue = np.clip(rvalue, -1, 1)
+    return slope, intercept, rvalue
+
+
+def freq_stats(seq):
+    """Computes the number of values, the mean, and the sum of squared
+    deviations from the mean (M2) separately for each frequency, ignoring nan
+    values. Frequencies correspond to the second-to-last axis of seq. The sum
+    of squares is computed in chunks of EPOCH_CHUNK_SIZE trials, so that seq
+    is never copied as a whole.
+    
+    Parameters
+    ----------
+    seq: array
+        An array with the shape (trials, [channels, ] frequencies, times)
+    
+    Returns
+    -------
+    tuple
+        A (count, mean, m2) tuple of arrays with one value per frequency. Stats
+        of different datasets can be combined with merge_freq_stats().
+    """
+    axes = tuple(i for i in range(seq.ndim) if i != seq.ndim - 2)
+    count = np.sum(~np.isnan(seq), axis=axes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(seq, axis=axes) / count
+    m2 = np.zeros(mean.shape)
+    for i in range(0, len(seq), EPOCH_CHUNK_SIZE):
+        m2 += np.nansum((seq[i:i + EPOCH_CHUNK_SIZE] - mean[:, None]) ** 2,
+                        axis=axes)
+    return count, mean, m2
+
+
+def merge_freq_stats(stats1, stats2):
+    """Combines the stats of two datasets, as returned by freq_stats(), into
+    the stats of the combined dataset. This is the parallel variant of
+    Welford's algorithm (Chan et al., 1979), which allows stats to be
+    accumulated one session at a time.
+    
+    Parameters
+    ----------
+    stats1: tuple
+    stats2: tuple
+    
+    Returns
+    -------
+    tuple
+    """
+    count1, mean1, m21 = stats1
+    count2, mean2, m22 = stats2
+    count = count1 + count2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(count > 0, count2 / count, 0)
+    delta = np.where(count2 > 0, mean2 - np.nan_to_num(mean1), 0)
+    mean = np.where(count1 > 0, mean1, 0) + delta * weight
+    mean[count == 0] = np.nan
+    m2 = m21 + m22 + delta ** 2 * count1 * weight
+    return count, mean, m2
+
+
+def z_by_freq(col, stats=None):
     """Performs z-scoring across trials, channels, and time points but 
-    separately for each frequency.
+    separately for each frequency. Changes col in place.
     
     Parameters
     ----------
     col: MultiDimensionalColumn
+    stats: tuple or None, optional
+        Stats as returned by freq_stats() or merge_freq_stats(), or None to
+        compute the stats from col.
     
     Returns
     -------
     MultiDimensionalColumn
     """
-    zcol = col[:]
-    for i in range(zcol.shape[2]):
-        zcol._seq[:, :, i] = (
-            (zcol._seq[:, :, i] - np.nanmean(zcol._seq[:, :, i]))
-            / np.nanstd(zcol._seq[:, :, i])
-        )
-    return zcol
+    if stats is None:
+        stats = freq_stats(col._seq)
+    count, mean, m2 = stats
+    col._seq -= mean[:, None]
+    col._seq /= np.sqrt(m2 / count)[:, None]
+    return col
 
 
 def read_subject(subject_nr):
-    return eet.read_subject(
-        subject_nr, folder=DATA_FOLDER, eeg_preprocessing=[
-            'drop_unused_channels',
-            'rereference_channels',
-            'annotate_emg',
-            'create_eog_channels',
-            'set_montage',
-            'band_pass_filter',
-            'autodetect_bad_channels',
-            'interpolate_bads'])
-    
-
-@fnc.memoize(persistent=True, key=f'../checkpoints/{CHECKPOINT}.dm')
-def get_merged_data():
-    dm = DataMatrix()
-    for subject_nr in SUBJECTS:
-        raw, events, metadata = read_subject(subject_nr)
-        events[0][:, 0] += STIMULUS_TRIGGER_ADJUSTMENT
-        sdm = cnv.from_pandas(metadata)
-        sdm.blink_latency = -1
-        trial_nr = -1
-        stim_onset = None
-        for a in raw.annotations:
-            if a['description'] == '1':
-                trial_nr += 1
-                stim_onset = a['onset']
-            if stim_onset is None:
-                continue
-            if a['description'] == 'BLINK':
-                blink_latency = a['onset'] - stim_onset
-                sdm.blink_latency[trial_nr] = blink_latency
-                stim_onset = None
-        sdm.pupil = cnv.from_mne_epochs(
-            eet.PupilEpochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                            tmin=PUPIL_EPOCH[0], tmax=PUPIL_EPOCH[1],
-                            metadata=metadata, baseline=None),
-            ch_avg=True)
-        sdm.gaze_x = cnv.from_mne_epochs(
-            eet.PupilEpochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                            tmin=PUPIL_EPOCH[0], tmax=PUPIL_EPOCH[1],
-                            metadata=metadata, baseline=None, channel='GazeX'),
-            ch_avg=True)
-        sdm.gaze_y = cnv.from_mne_epochs(
-            eet.PupilEpochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                            tmin=PUPIL_EPOCH[0], tmax=PUPIL_EPOCH[1],
-                            metadata=metadata, baseline=None, channel='GazeY'),
-            ch_avg=True)
-        sdm.eog = cnv.from_mne_epochs(
-            mne.Epochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                       tmin=EEG_EPOCH[0], tmax=EEG_EPOCH[1],
-                       picks='eog', metadata=metadata))
-        sdm.eog_nobaseline = cnv.from_mne_epochs(
-            mne.Epochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                       tmin=EEG_EPOCH[0], tmax=EEG_EPOCH[1],
-                       picks='eog', metadata=metadata, baseline=None))
-        sdm.erp = cnv.from_mne_epochs(
-            mne.Epochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                       tmin=EEG_EPOCH[0], tmax=EEG_EPOCH[1],
-                       picks='eeg', metadata=metadata))
-        sdm.erp_nobaseline = cnv.from_mne_epochs(
-            mne.Epochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                       tmin=EEG_EPOCH[0], tmax=EEG_EPOCH[1],
-                       picks='eeg', metadata=metadata, baseline=None))
-        # Get time-frequency analyses
-        epochs = mne.Epochs(raw, eet.epoch_trigger(events, STIMULUS_TRIGGER),
-                       tmin=EEG_EPOCH[0] - MORLET_MARGIN,
-                       tmax=EEG_EPOCH[0] + MORLET_MARGIN, picks='eog',
-                       metadata=metadata)
-        morlet = tfr_morlet(
-            epochs, freqs=FREQS, n_cycles=2, n_jobs=-1,
-            return_itc=False, use_fft=True, average=False,
-            decim=5, picks=np.arange(len(epochs.info['ch_names'])))
-        morlet.crop(0, EEG_EPOCH[1])
-        sdm.eog_tfr = cnv.from_mne_tfr(morlet)
+    return eet.read_subject(subject_nr, folder=DATA_FOLDER,
+                            eeg_preprocessing=EEG_PREPROCESSING)
+    
+
+def blinks_by_trial(annotations, n_trials, trigger='1', blink='BLINK'):
+    """Determines the blinks for each trial based on annotations. A blink is
+    assigned to a trial if it starts at or after the stimulus trigger of that
+    trial and before the stimulus trigger of the next trial.
+    
+    Parameters
+    ----------
+    annotations: Annotations
+    n_trials: int
+    trigger: str, optional
+        The description of stimulus-trigger annotations.
+    blink: str, optional
+        The description of blink annotations.
+    
+    Returns
+    -------
+    tuple
+        A (latency, count, duration) tuple of arrays of length n_trials. The
+        latency is the time from the stimulus trigger until the first blink,
+        or -1 if there was no blink. The duration is the total duration of
+        all blinks.
+    """
+    description = np.asarray(annotations.description)
+    stim_onset = annotations.onset[description == trigger]
+    is_blink = description == blink
+    blink_onset = annotations.onset[is_blink]
+    blink_duration = annotations.duration[is_blink]
+    # Blinks that occur before the first stimulus trigger are ignored
+    trial = np.searchsorted(stim_onset, blink_onset, side='right') - 1
+    blink_onset = blink_onset[trial >= 0]
+    blink_duration = blink_duration[trial >= 0]
+    trial = trial[trial >= 0]
+    latency = np.full(n_trials, -1.)
+    # Annotations are sorted by onset, so the first index of each trial
+    # corresponds to the first blink
+    first_trial, first_blink = np.unique(trial, return_index=True)
+    latency[first_trial] = blink_onset[first_blink] - stim_onset[first_trial]
+    count = np.bincount(trial, minlength=n_trials)
+    duration = np.bincount(trial, weights=blink_duration, minlength=n_trials)
+    return latency, count, duration
+
+
+def _epoch_windows(raw, events, windows):
+    """Reads epochs around events in chunks of EPOCH_CHUNK_SIZE, in the order
+    of the events, and yields the data for one or more time windows from each
+    chunk. For each chunk, the segment of the raw data that spans all windows
+    is read once, so that only one chunk of epochs is in memory at a time in
+    addition to the raw data itself. Epochs for which a window overlaps with a
+    bad annotation are set to nan for that window, which mimics
+    reject_by_annotation=True in mne.Epochs(). Similarly, epochs for which a
+    window extends beyond the recording are set to nan for that window only,
+    rather than being dropped altogether.
+    
+    Parameters
+    ----------
+    raw: Raw
+    events: array
+        Events as expected by mne.Epochs()
+    windows: list of tuple
+        A list of (picks, tmin, tmax) tuples, where picks is a list of
+        channel names.
+    
+    Yields
+    ------
+    tuple
+        An (item, data) tuple, where item is an array of epoch indices and
+        data is a list with one array with the shape (epochs, channels,
+        samples) for each window.
+    """
+    sfreq = raw.info['sfreq']
+    picks = list(dict.fromkeys(name for window in windows
+                               for name in window[0]))
+    annotations = raw.annotations
+    is_bad = np.array([description.lower().startswith('bad')
+                       for description in annotations.description],
+                      dtype=bool)
+    onset = _sync_onset(raw, annotations.onset)[is_bad]
+    offset = onset + annotations.duration[is_bad]
+    selections = []
+    for window_picks, tmin, tmax in windows:
+        n_samples = len(_window_times(sfreq, tmin, tmax))
+        start = events[:, 0] - raw.first_samp + int(round(tmin * sfreq))
+        stop = start + n_samples
+        rejected = np.any((onset < stop[:, None] / sfreq)
+                          & (offset > start[:, None] / sfreq), axis=1)
+        rejected |= (start < 0) | (stop > raw.n_times)
+        channels = [picks.index(name) for name in window_picks]
+        selections.append((channels, start, n_samples, rejected))
+    for i in range(0, len(events), EPOCH_CHUNK_SIZE):
+        item = np.arange(i, min(i + EPOCH_CHUNK_SIZE, len(events)))
+        first = max(0, min(start[item].min()
+                           for _, start, _, _ in selections))
+        last = min(raw.n_times, max(start[item].max() + n_samples
+                                    for _, start, n_samples, _
+                                    in selections))
+        segment = raw.get_data(picks=picks, start=first, stop=last)
+        data = []
+        for channels, start, n_samples, rejected in selections:
+            window = np.full((len(item), len(channels), n_samples), np.nan)
+            valid = ~rejected[item]
+            if valid.any():
+                index = start[item[valid]][:, None] - first \
+                    + np.arange(n_samples)
+                window[valid] = segment[channels][:, index].swapaxes(0, 1)
+            data.append(window)
+        yield item, data
+
+
+def _window_times(sfreq, tmin, tmax):
+    """Returns the times of the samples of a window, as for mne.Epochs().
+    """
+    return np.arange(int(round(tmin * sfreq)), int(round(tmax * sfreq)) + 1) \
+        / sfreq
+
+
+def _baseline(data, times):
+    """Applies a (None, 0) baseline correction, which is the default of
+    mne.Epochs(), to an array with the shape (epochs, channels, samples).
+    """
+    return data - data[..., times <= 0].mean(axis=-1, keepdims=True)
+
+
+def _epochs_column(dm, index, info, data, times, *names, ch_avg=False):
+    """Creates a column from epoched data. This is similar to
+    cnv.from_mne_epochs() and cnv.from_mne_tfr() in that dropped epochs
+    result in nan values. The shape of the column is specified by names (e.g.
+    channels and frequencies) and times.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    index: array
+        The rows of dm that correspond to the epochs, i.e. the index of the
+        epochs metadata
+    info: Info
+        The measurement info, which is stored as column metadata
+    data: array
+        An array in which the first axis corresponds to epochs
+    times: array
+    *names: list
+    ch_avg: bool, optional
+        Indicates whether data should be averaged over the second axis.
+    
+    Returns
+    -------
+    MultiDimensionalColumn
+    """
+    if ch_avg:
+        data = data.mean(axis=1)
+    seq = np.full((len(dm), ) + data.shape[1:], np.nan)
+    seq[index] = data
+    return MultiDimensionalColumn(shape=tuple(names) + (times, ), seq=seq,
+                                  metadata=info)
+
+
+@functools.lru_cache()
+def morlet_bank(sfreq, freqs, n_cycles, n_times):
+    """Returns the Fourier transforms of a bank of zero-mean Morlet wavelets,
+    as used by tfr_array_morlet(). The bank is computed once for each
+    combination of parameters.
+    
+    Parameters
+    ----------
+    sfreq: float
+    freqs: tuple
+    n_cycles: float
+    n_times: int
+        The number of samples of the signals that are transformed.
+    
+    Returns
+    -------
+    tuple
+        An (fft_wavelets, offsets) tuple, where fft_wavelets is an array with
+        the shape (freqs, nfft) and offsets are the sample indices in the
+        convolution that correspond to the first sample of the signal.
+    """
+    wavelets = morlet(sfreq, np.array(freqs), n_cycles=n_cycles,
+                      zero_mean=True)
+    nfft = fft.next_fast_len(
+        n_times + max(wavelet.size for wavelet in wavelets) - 1)
+    fft_wavelets = np.array([fft.fft(wavelet, nfft) for wavelet in wavelets])
+    offsets = np.array([(wavelet.size - 1) // 2 for wavelet in wavelets])
+    return fft_wavelets, offsets
+
+
+def morlet_power(data, sfreq, freqs, n_cycles, decim=1, crop=None,
+                 n_jobs=-1):
+    """Computes time-frequency power with Morlet wavelets. This gives the same
+    result as tfr_array_morlet() with zero_mean=True, use_fft=True, and
+    output='power', but all signals are transformed at once, and only the
+    samples that are selected by decim and crop are computed and stored.
+    
+    Parameters
+    ----------
+    data: array
+        An array with the shape (epochs, channels, samples)
+    sfreq: float
+    freqs: array
+    n_cycles: float
+    decim: int, optional
+    crop: array or None, optional
+        A boolean mask that selects samples after decimation.
+    n_jobs: int, optional
+        The number of workers used for the Fourier transforms.
+    
+    Returns
+    -------
+    array
+        An array with the shape (epochs, channels, freqs, samples)
+    """
+    fft_wavelets, offsets = morlet_bank(sfreq, tuple(freqs), n_cycles,
+                                        data.shape[-1])
+    samples = np.arange(0, data.shape[-1], decim)
+    if crop is not None:
+        samples = samples[crop]
+    fft_data = fft.fft(data, fft_wavelets.shape[1], axis=-1, workers=n_jobs)
+    power = np.empty(data.shape[:-1] + (len(freqs), len(samples)))
+    for i, (fft_wavelet, offset) in enumerate(zip(fft_wavelets, offsets)):
+        coefs = fft.ifft(fft_data * fft_wavelet, axis=-1,
+                         workers=n_jobs)[..., offset + samples]
+        power[..., i, :] = coefs.real ** 2 + coefs.imag ** 2
+    return power
+
+
+def cached_morlet_power(data, sfreq, freqs, n_cycles, decim=1, crop=None,
+                        n_jobs=-1):
+    """Computes time-frequency power with morlet_power(), or reads it from
+    TFR_CACHE_FOLDER if it has been computed before for the same data and
+    parameters. See morlet_power() for the parameters. The cache is keyed by
+    the data, sfreq, freqs, n_cycles, and decim, and contains the power of
+    all decimated samples. The crop is applied afterwards, so that the same
+    cache is used for different crops. Reading a cache file updates its
+    modification time, which is used by get_merged_data() to remove cache
+    files that are no longer used (see prune_tfr_cache()).
+    
+    Returns
+    -------
+    array
+    """
+    sha1 = hashlib.sha1(np.ascontiguousarray(data).tobytes())
+    sha1.update(json.dumps([
+        data.shape, sfreq, np.asarray(freqs).tolist(), n_cycles,
+        decim]).encode())
+    path = TFR_CACHE_FOLDER / f'{sha1.hexdigest()}.npy'
+    if path.exists():
+        path.touch()
+        power = np.load(path, mmap_mode='r')
+    else:
+        power = morlet_power(data, sfreq, freqs, n_cycles, decim=decim,
+                             n_jobs=n_jobs)
+        TFR_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that a crash doesn't leave
+        # behind an incomplete file that looks like a valid cache
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('wb') as fd:
+            np.save(fd, power)
+        tmp_path.replace(path)
+    if crop is not None:
+        return np.array(power[..., crop])
+    return np.array(power)
+
+
+def tfr_cache_marker():
+    """Updates the modification time of a marker file in TFR_CACHE_FOLDER, and
+    returns this time. Cache files that are used or created afterwards have
+    a later modification time.
+    
+    Returns
+    -------
+    int
+        The modification time in nanoseconds.
+    """
+    TFR_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+    marker = TFR_CACHE_FOLDER / '.marker'
+    marker.touch()
+    return marker.stat().st_mtime_ns
+
+
+def prune_tfr_cache(since):
+    """Removes the cache files of cached_morlet_power() that have not been
+    used or created since a time as returned by tfr_cache_marker().
+    
+    Parameters
+    ----------
+    since: int
+    """
+    for path in TFR_CACHE_FOLDER.glob('*.npy'):
+        if path.stat().st_mtime_ns < since:
+            path.unlink()
+
+
+def get_subject_data(subject_nr, n_jobs=-1):
+    """Reads and preprocesses a single session, and returns the per-trial
+    data as a DataMatrix. This is the expensive part of get_merged_data(), and
+    each session is processed independently of the others.
+    
+    Parameters
+    ----------
+    subject_nr: int
+    n_jobs: int, optional
+        The number of jobs used for the time-frequency analysis.
+    
+    Returns
+    -------
+    tuple
+        A (DataMatrix, stats) tuple. If TFR_Z_SCOPE is 'merged', stats are
+        the per-frequency stats of the time-frequency power, as returned by
+        freq_stats(), and otherwise None.
+    """
+    raw, events, metadata = read_subject(subject_nr)
+    events[0][:, 0] += STIMULUS_TRIGGER_ADJUSTMENT
+    sdm = cnv.from_pandas(metadata)
+    sdm.blink_latency, sdm.blink_count, sdm.blink_duration = \
+        blinks_by_trial(raw.annotations, len(sdm))
+    # All signals are extracted in a single pass over the trials. Bad
+    # annotations and the edges of the recording are checked separately for
+    # each window, so that the same epochs are rejected as when epoching each
+    # window separately.
+    tfr_epoch = EEG_EPOCH[0] - MORLET_MARGIN, EEG_EPOCH[0] + MORLET_MARGIN
+    eeg_names = [raw.ch_names[i] for i in mne.pick_types(raw.info, eeg=True)]
+    eog_names = [raw.ch_names[i]
+                 for i in mne.pick_types(raw.info, eeg=False, eog=True)]
+    eye_names = ['PupilSize', 'GazeX', 'GazeY']
+    trigger_events = eet.epoch_trigger(events, STIMULUS_TRIGGER)
+    # The epochs are processed one chunk at a time, and only the windows that
+    # are stored are kept in memory. The time-frequency analysis is done for
+    # each chunk separately, and only for the epochs that were not rejected,
+    # similar to tfr_morlet(). Only the power within the cropped window is
+    # computed.
+    sfreq = raw.info['sfreq']
+    eye_times = _window_times(sfreq, *PUPIL_EPOCH)
+    eeg_times = _window_times(sfreq, *EEG_EPOCH)
+    tfr_eog_times = _window_times(sfreq, *tfr_epoch)
+    decim = 5
+    tfr_times = tfr_eog_times[::decim]
+    crop = _time_mask(tfr_times, 0, EEG_EPOCH[1], sfreq=sfreq / decim)
+    n_epochs = len(trigger_events)
+    eye = np.empty((n_epochs, len(eye_names), len(eye_times)))
+    eog = np.empty((n_epochs, len(eog_names), len(eeg_times)))
+    erp = np.empty((n_epochs, len(eeg_names), len(eeg_times)))
+    tfr = np.full((n_epochs, len(eog_names), len(FREQS), crop.sum()), np.nan)
+    windows = [(eye_names, *PUPIL_EPOCH), (eog_names, *EEG_EPOCH),
+               (eeg_names, *EEG_EPOCH), (eog_names, *tfr_epoch)]
+    for item, data in _epoch_windows(raw, trigger_events, windows):
+        eye[item], eog[item], erp[item] = data[:3]
+        tfr_eog = _baseline(data[3], tfr_eog_times)
+        valid = ~np.isnan(tfr_eog).any(axis=(1, 2))
+        if not valid.any():
+            continue
+        tfr[item[valid]] = cached_morlet_power(
+            tfr_eog[valid], sfreq, FREQS, n_cycles=2, decim=decim, crop=crop,
+            n_jobs=n_jobs)
+    # The raw data is no longer needed
+    index = np.arange(n_epochs)
+    info = mne.pick_info(raw.info, mne.pick_channels(
+        raw.ch_names, eeg_names + eog_names + eye_names, ordered=True))
+    del raw
+    sdm.pupil = _epochs_column(sdm, index, info, eye[:, :1], eye_times,
+                               ch_avg=True)
+    sdm.gaze_x = _epochs_column(sdm, index, info, eye[:, 1:2], eye_times,
+                                ch_avg=True)
+    sdm.gaze_y = _epochs_column(sdm, index, info, eye[:, 2:], eye_times,
+                                ch_avg=True)
+    del eye
+    if GAZE_KINEMATICS:
+        for name, value in gaze_kinematics(sdm.gaze_x, sdm.gaze_y,
+                                           sfreq=sfreq).items():
+            sdm[name] = value
+    sdm.eog_nobaseline = _epochs_column(sdm, index, info, eog, eeg_times,
+                                        eog_names)
+    sdm.eog = _epochs_column(sdm, index, info, _baseline(eog, eeg_times),
+                             eeg_times, eog_names)
+    del eog
+    sdm.erp_nobaseline = _epochs_column(sdm, index, info, erp, eeg_times,
+                                        eeg_names)
+    sdm.erp = _epochs_column(sdm, index, info, _baseline(erp, eeg_times),
+                             eeg_times, eeg_names)
+    del erp
+    sdm.eog_tfr = _epochs_column(sdm, index, info, tfr, tfr_times[crop],
+                                 eog_names, FREQS.astype(float))
+    if TFR_Z_SCOPE == 'session':
+        stats = None
         sdm.eog_tfr = z_by_freq(sdm.eog_tfr)[:, ...]
-        # The subject number is the first digit, the session number the second
-        if MULTISESSION:
-            sdm.session_nr = sdm.subject_nr % 10
-            sdm.subject_nr = sdm.subject_nr // 10
+    else:
+        # The stats are returned so that get_merged_data() can z-score across
+        # sessions. Because z-scoring is the same for all channels, it can
+        # be applied after averaging over channels.
+        stats = freq_stats(sdm.eog_tfr._seq)
+        sdm.eog_tfr = sdm.eog_tfr[:, ...]
+    # The subject number is the first digit, the session number the second
+    if MULTISESSION:
+        sdm.session_nr = sdm.subject_nr % 10
+        sdm.subject_nr = sdm.subject_nr // 10
+    else:
+        sdm.session_nr = 1
+    sdm.erg = sdm.eog[:, ...]
+    sdm.erg_nobaseline = sdm.eog_nobaseline[:, ...]
+    sdm.erg_upper = sdm.eog[:, ('VEOGB', 'VEOGT')][:, ...]
+    sdm.erg_lower = sdm.eog[:, ('HEOGL', 'HEOGR')][:, ...]
+    sdm.laterg = sdm.eog[:, ('VEOGB', 'HEOGL')][:, ...] - \
+        sdm.eog[:, ('VEOGT', 'HEOGR')][:, ...]
+    sdm.erp_occipital = sdm.erp[:, ('O1', 'Oz', 'O2')][:, ...]
+    sdm.erp_occipital_nobaseline = sdm.erp_nobaseline[:, ('O1', 'Oz', 'O2')][:, ...]
+    sdm.laterp_occipital = sdm.erp[:, 'O1'] - sdm.erp[:, 'O2']
+    # We first convert pupil size to millimeters, and then take the mean
+    # over the first 150 ms (below the response latency), The slope is also
+    # calculated over this initial 150 ms.
+    sdm.pupil = sdm.pupil @ area_to_mm
+    sdm.mean_pupil = sdm.pupil[:, 0:150][:, ...]
+    sdm.pupil_slope, _, _ = linregress_rows(np.arange(150),
+                                            sdm.pupil._seq[:, :150])
+    # We recode pupil size as surface area (as opposed to diamter),
+    # baseline size, and z-scored values. We also make a binary split
+    # on the slope indicating whether the pupil was constricting or
+    # dilating.
+    sdm.mean_pupil_area = sdm.mean_pupil ** 2
+    sdm.influx_adjustment = sdm.mean_pupil_area / sdm.mean_pupil_area.mean
+    sdm.bl_pupil = srs.baseline(sdm.pupil, sdm.pupil, 0, 50)
+    sdm.z_pupil = ops.z(sdm.mean_pupil)
+    sdm.z_pupil_slope = ops.z(sdm.pupil_slope)
+    sdm.pupil_dilation = 'Constricting'
+    sdm.pupil_dilation[sdm.pupil_slope > 0] = 'Dilating'
+    sdm.z_erg = ops.z(sdm.erg[:, 115:140][:, ...])
+    return sdm, stats
+
+
+def _file_hash(path, index):
+    """Returns the sha1 hash of a file. Hashing raw data is slow, and hashes
+    are therefore stored in an index by path, size, and modification time.
+    """
+    stat = path.stat()
+    index_key = f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+    if index_key not in index:
+        sha1 = hashlib.sha1()
+        with path.open('rb') as fd:
+            for chunk in iter(lambda: fd.read(2 ** 20), b''):
+                sha1.update(chunk)
+        index[index_key] = sha1.hexdigest()
+    return index[index_key]
+
+
+def session_cache_path(subject_nr):
+    """Returns the path of the cached, preprocessed data of a single session.
+    The file name contains a hash of the raw data files and all settings that
+    affect preprocessing, so that the path changes whenever the session needs
+    to be processed again.
+    
+    Parameters
+    ----------
+    subject_nr: int
+    
+    Returns
+    -------
+    Path
+    """
+    subject_path = Path(DATA_FOLDER) / f'sub-{subject_nr:02d}'
+    index_path = SESSION_CACHE_FOLDER / 'file-hashes.json'
+    index = json.loads(index_path.read_text()) if index_path.exists() else {}
+    raw_files = sorted(
+        path for folder in ('eeg', 'beh', 'eyetracking')
+        for path in (subject_path / folder).rglob('*')
+        if path.is_file() and not path.name.startswith('.'))
+    if not raw_files:
+        raise FileNotFoundError(f'no raw data found in {subject_path}')
+    key = json.dumps([
+        subject_nr,
+        [(str(path.relative_to(subject_path)), _file_hash(path, index))
+         for path in raw_files],
+        EEG_PREPROCESSING, EEG_EPOCH, PUPIL_EPOCH, FREQS.tolist(),
+        MORLET_MARGIN, STIMULUS_TRIGGER, STIMULUS_TRIGGER_ADJUSTMENT,
+        MULTISESSION, TFR_Z_SCOPE, GAZE_KINEMATICS, PREPROCESSING_VERSION])
+    index_path.write_text(json.dumps(index, indent=1))
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return SESSION_CACHE_FOLDER / f'sub-{subject_nr:02d}-{digest}.dm'
+
+
+def tfr_stats_path(path):
+    """Returns the path of the per-frequency stats of the time-frequency power
+    of a single session, which are stored next to the session data if
+    TFR_Z_SCOPE is 'merged'.
+    
+    Parameters
+    ----------
+    path: Path
+        As returned by session_cache_path()
+    
+    Returns
+    -------
+    Path
+    """
+    return path.with_name(f'{path.stem}-tfr-stats.npz')
+
+
+def session_channels_path(path):
+    """Returns the path of the channel information of a single session, which
+    is stored next to the session data, so that it can be read without
+    reading the session data.
+    
+    Parameters
+    ----------
+    path: Path
+        As returned by session_cache_path()
+    
+    Returns
+    -------
+    Path
+    """
+    return path.with_name(f'{path.stem}-channels.json')
+
+
+def cache_subject_data(subject_nr, path, n_jobs=-1):
+    """Preprocesses a single session with get_subject_data() and writes the
+    result to path, unless this file already exists. The per-frequency stats
+    of the time-frequency power, if any, are written to tfr_stats_path(), and
+    the channel information to session_channels_path().
+    
+    Parameters
+    ----------
+    subject_nr: int
+    path: Path
+        As returned by session_cache_path()
+    n_jobs: int, optional
+        The number of jobs used for the time-frequency analysis.
+    
+    Returns
+    -------
+    Path
+    """
+    if not path.exists():
+        # Write to a temporary file first so that a crash doesn't leave behind
+        # an incomplete file that looks like a valid cache
+        tmp_path = path.with_suffix('.tmp')
+        sdm, stats = get_subject_data(subject_nr, n_jobs=n_jobs)
+        # The stats and channel information are written first, so that they
+        # exist whenever the session data exists
+        tmp_path.write_text(json.dumps(_channel_info(sdm.erp.metadata),
+                                       indent=1))
+        tmp_path.replace(session_channels_path(path))
+        if stats is not None:
+            with tmp_path.open('wb') as fd:
+                np.savez(fd, **dict(zip(('count', 'mean', 'm2'), stats)))
+            tmp_path.replace(tfr_stats_path(path))
+        io.writebin(sdm, tmp_path)
+        tmp_path.replace(path)
+    return path
+
+
+def _json_safe(values):
+    """Converts a sequence of values, which may include numpy scalars, to a
+    list that can be serialized to json.
+    """
+    return [value.item() if isinstance(value, np.generic) else value
+            for value in values]
+
+
+def write_columnar(dm, path, key=None, channel_info=None):
+    """Writes a DataMatrix to a folder with one .npy file per numeric or
+    multidimensional column, one .json file per mixed column, and a
+    columns.json file that describes the columns. This format allows columns
+    to be read selectively and memory-mapped by read_columnar(). Column
+    metadata, such as mne.Info objects, is not stored, but channel
+    information can be stored as channels.json in the same folder.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    path: Path
+    key: str or None, optional
+        A key that identifies the data, as returned by read_columnar_key().
+    channel_info: dict or None, optional
+        Channel information as returned by read_channel_info().
+    """
+    # Write to a temporary folder first so that a crash doesn't leave behind
+    # an incomplete checkpoint
+    tmp_path = path.with_name(f'.{path.name}')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+    columns = []
+    for name, col in dm.columns:
+        if isinstance(col, _MultiDimensionalColumn):
+            np.save(tmp_path / f'{name}.npy', col._seq)
+            if isinstance(col, _SeriesColumn):
+                kind, shape = 'series', [col.depth]
+            else:
+                kind, shape = 'multidimensional', []
+                for names in col.index_names:
+                    names = _json_safe(names)
+                    shape.append(len(names) if names == list(range(len(names)))
+                                 else names)
+        elif isinstance(col, (FloatColumn, IntColumn)):
+            np.save(tmp_path / f'{name}.npy', col._seq)
+            kind = 'float' if isinstance(col, FloatColumn) else 'int'
+            shape = None
         else:
-            sdm.session_nr = 1
-        sdm.erg = sdm.eog[:, ...]
-        sdm.erg_nobaseline = sdm.eog_nobaseline[:, ...]
-        sdm.erg_upper = sdm.eog[:, ('VEOGB', 'VEOGT')][:, ...]
-        sdm.erg_lower = sdm.eog[:, ('HEOGL', 'HEOGR')][:, ...]
-        sdm.laterg = sdm.eog[:, ('VEOGB', 'HEOGL')][:, ...] - \
-            sdm.eog[:, ('VEOGT', 'HEOGR')][:, ...]
-        sdm.erp_occipital = sdm.erp[:, ('O1', 'Oz', 'O2')][:, ...]
-        sdm.erp_occipital_nobaseline = sdm.erp_nobaseline[:, ('O1', 'Oz', 'O2')][:, ...]
-        sdm.laterp_occipital = sdm.erp[:, 'O1'] - sdm.erp[:, 'O2']
-        # We first convert pupil size to millimeters, and then take the mean
-        # over the first 150 ms (below the response latency), The slope is also
-        # calculated over this initial 150 ms.
-        sdm.pupil = sdm.pupil @ area_to_mm
-        sdm.mean_pupil = sdm.pupil[:, 0:150][:, ...]
-        x = np.arange(150)
-        for row in sdm:
-            result = linregress(x, row.pupil[:150])
-            row.pupil_slope = result.slope
-        # We recode pupil size as surface area (as opposed to diamter),
-        # baseline size, and z-scored values. We also make a binary split
-        # on the slope indicating whether the pupil was constricting or
-        # dilating.
-        sdm.mean_pupil_area = sdm.mean_pupil ** 2
-        sdm.influx_adjustment = sdm.mean_pupil_area / sdm.mean_pupil_area.mean
-        sdm.bl_pupil = srs.baseline(sdm.pupil, sdm.pupil, 0, 50)
-        sdm.z_pupil = ops.z(sdm.mean_pupil)
-        sdm.z_pupil_slope = ops.z(sdm.pupil_slope)
-        sdm.pupil_dilation = 'Constricting'
-        sdm.pupil_dilation[sdm.pupil_slope > 0] = 'Dilating'
-        sdm.z_erg = ops.z(sdm.erg[:, 115:140][:, ...])
+            (tmp_path / f'{name}.json').write_text(
+                json.dumps(_json_safe(col._seq)))
+            kind, shape = 'mixed', None
+        columns.append({'name': name, 'kind': kind, 'shape': shape})
+    if channel_info is not None:
+        (tmp_path / 'channels.json').write_text(
+            json.dumps(channel_info, indent=1))
+    (tmp_path / 'columns.json').write_text(json.dumps(
+        {'length': len(dm), 'key': key, 'columns': columns}, indent=1))
+    if path.exists():
+        shutil.rmtree(path)
+    tmp_path.rename(path)
+
+
+def read_columnar_key(path):
+    """Returns the key of data written by write_columnar(), or None if the
+    data doesn't exist.
+    
+    Parameters
+    ----------
+    path: Path
+    
+    Returns
+    -------
+    str or None
+    """
+    if not (path / 'columns.json').exists():
+        return None
+    return json.loads((path / 'columns.json').read_text())['key']
+
+
+def read_columnar(path, columns=None):
+    """Reads a DataMatrix that was written by write_columnar(). Series and
+    multidimensional columns are memory-mapped, so that only data that is
+    actually used is read from disk. Changes to these columns are kept in
+    memory and not written back to disk.
+    
+    Parameters
+    ----------
+    path: Path
+    columns: list or None, optional
+        The names of the columns to read, or None to read all columns. Names
+        of columns that don't exist are ignored.
+    
+    Returns
+    -------
+    DataMatrix
+    """
+    info = json.loads((path / 'columns.json').read_text())
+    dm = DataMatrix(length=info['length'])
+    for column in info['columns']:
+        name, kind, shape = column['name'], column['kind'], column['shape']
+        if columns is not None and name not in columns:
+            continue
+        if kind == 'mixed':
+            dm[name] = json.loads((path / f'{name}.json').read_text())
+            continue
+        if kind in ('float', 'int'):
+            dm[name] = FloatColumn if kind == 'float' else IntColumn
+            dm[name] = np.load(path / f'{name}.npy')
+            continue
+        seq = np.load(path / f'{name}.npy', mmap_mode='c')
+        # By default, columns that fit into memory are loaded, which means
+        # that the memory-mapped array would be read entirely. Columns are
+        # therefore temporarily forced to remain unloaded.
+        always_load_max_size = cfg.always_load_max_size
+        never_load_min_size = cfg.never_load_min_size
+        cfg.always_load_max_size = cfg.never_load_min_size = 0
+        try:
+            if kind == 'series':
+                dm[name] = SeriesColumn(depth=shape[0], seq=seq)
+            else:
+                dm[name] = MultiDimensionalColumn(shape=tuple(shape),
+                                                  seq=seq)
+        finally:
+            cfg.always_load_max_size = always_load_max_size
+            cfg.never_load_min_size = never_load_min_size
+    return dm
+
+
+def apply_precision(dm, precision):
+    """Converts the columns that match FLOAT32_COLUMNS to single precision if
+    precision is 'float32'. Changes dm in place.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    precision: str
+        'float64' or 'float32'
+    """
+    if precision not in ('float64', 'float32'):
+        raise ValueError(f'invalid precision: {precision}')
+    if precision == 'float64':
+        return
+    for name, col in dm.columns:
+        if not isinstance(col, _MultiDimensionalColumn):
+            continue
+        if any(fnmatch.fnmatchcase(name, pattern)
+               for pattern in FLOAT32_COLUMNS):
+            col._seq = col._seq.astype(np.float32)
+
+
+def _limit_memory(max_memory):
+    """Initializes a worker process by limiting its address space. The limit
+    is skipped on systems without the resource module, such as Windows.
+    """
+    if max_memory is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        logger.warning('memory limit is not supported on this system')
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+
+def get_merged_data(columns=None, precision=None):
+    """Returns the merged and filtered data of all sessions. The merged data
+    is stored as a columnar checkpoint (see write_columnar()), which is
+    memory-mapped when it is read. If the raw data or the preprocessing
+    settings change, only the affected sessions are processed again. If the
+    raw data is not available, for example because only the checkpoint has
+    been downloaded, the checkpoint is used as is.
+    
+    Parameters
+    ----------
+    columns: list or None, optional
+        The names of the columns to load, or None to load all columns. The
+        columns that filter_dm() depends on (FILTER_COLUMNS) are always loaded
+        as well.
+    precision: str or None, optional
+        'float64' or 'float32' to store the columns that match FLOAT32_COLUMNS
+        with single precision, or None to use PRECISION. Each precision has a
+        separate checkpoint.
+    
+    Returns
+    -------
+    DataMatrix
+    """
+    if columns is not None:
+        columns = list(columns) + [name for name in FILTER_COLUMNS
+                                   if name not in columns]
+    if precision is None:
+        precision = PRECISION
+    merged_path = CHECKPOINT_FOLDER / CHECKPOINT
+    if precision != 'float64':
+        merged_path = merged_path.with_name(f'{CHECKPOINT}-{precision}')
+    if not Path(DATA_FOLDER).exists():
+        double_path = CHECKPOINT_FOLDER / CHECKPOINT
+        if not merged_path.exists() and not double_path.exists():
+            # Checkpoints from before the columnar format can only be read as
+            # a whole. They are converted once, so that afterwards only the
+            # requested columns are read.
+            legacy_path = double_path.with_suffix('.dm')
+            if not legacy_path.exists():
+                raise FileNotFoundError(
+                    f'neither raw data ({DATA_FOLDER}) nor a checkpoint '
+                    f'({double_path} or {legacy_path}) was found')
+            dm = io.readbin(legacy_path)
+            channel_info = _channel_info(dm.erp.metadata) \
+                if 'erp' in dm and isinstance(dm.erp.metadata, mne.Info) \
+                else None
+            write_columnar(dm, double_path, channel_info=channel_info)
+            del dm
+        _restore_channel_info(merged_path / 'channels.json')
+        _restore_channel_info(double_path / 'channels.json')
+        if merged_path.exists():
+            return read_columnar(merged_path, columns)
+        # Without the raw data, the reduced-precision data is derived from the
+        # double-precision checkpoint
+        dm = read_columnar(double_path, columns)
+        apply_precision(dm, precision)
+        return dm
+    SESSION_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+    session_paths = [session_cache_path(subject_nr)
+                     for subject_nr in SUBJECTS]
+    key = hashlib.sha1(json.dumps(
+        [path.name for path in session_paths] + [Z_THRESHOLD, precision,
+                                                 FLOAT32_COLUMNS]
+    ).encode()).hexdigest()
+    if read_columnar_key(merged_path) == key:
+        # Checkpoints from before the channel information was stored with
+        # the checkpoint fall back to the channel information of a session
+        _restore_channel_info(merged_path / 'channels.json')
+        _restore_channel_info(session_channels_path(session_paths[0]))
+        return read_columnar(merged_path, columns)
+    # Time-frequency power that is not used by the sessions that are processed
+    # now is removed afterwards, so that the cache doesn't keep growing with
+    # every change to the preprocessing
+    run_start = tfr_cache_marker() \
+        if not all(path.exists() for path in session_paths) else None
+    if N_PROCESSES > 1:
+        # Each worker processes one session at a time. The time-frequency
+        # analysis is then run in a single job to avoid oversubscription.
+        with ProcessPoolExecutor(N_PROCESSES, initializer=_limit_memory,
+                                 initargs=(MAX_MEMORY_PER_PROCESS, )) \
+                as executor:
+            list(executor.map(cache_subject_data, SUBJECTS, session_paths,
+                              [1] * len(SUBJECTS)))
+    else:
+        for subject_nr, path in zip(SUBJECTS, session_paths):
+            cache_subject_data(subject_nr, path)
+    if run_start is not None:
+        prune_tfr_cache(run_start)
+    # Sessions are merged in the order of SUBJECTS, so that the result doesn't
+    # depend on how the sessions were processed
+    dm = DataMatrix()
+    stats = None
+    info = None
+    for path in session_paths:
+        sdm = io.readbin(path)
+        if info is None:
+            info = sdm.erp.metadata
+        if TFR_Z_SCOPE == 'merged':
+            with np.load(tfr_stats_path(path)) as npz:
+                session_stats = tuple(npz[name]
+                                      for name in ('count', 'mean', 'm2'))
+            stats = session_stats if stats is None \
+                else merge_freq_stats(stats, session_stats)
         dm <<= sdm
+    del sdm
+    if TFR_Z_SCOPE == 'merged':
+        z_by_freq(dm.eog_tfr, stats)
     dm = dm.z_erg != np.nan
     dm = dm.mean_pupil != np.nan
     dm = dm.z_erg < Z_THRESHOLD
@@ -263,7 +1161,12 @@ def get_merged_data():
         dm.influx_cdm2 = dm.intensity_cdm2 * dm.mean_pupil ** 2
     dm.has_blink = 0
     dm.has_blink[dm.blink_latency >= 0] = 1
-    return dm
+    apply_precision(dm, precision)
+    channel_info = _channel_info(info)
+    write_columnar(dm, merged_path, key=key, channel_info=channel_info)
+    _write_channel_info(channel_info)
+    del dm
+    return read_columnar(merged_path, columns)
 
 
 def add_bin_pupil(dm):
@@ -282,7 +1185,7 @@ def add_bin_pupil(dm):
 
 
 def filter_dm(dm, del_erp=True):
-    if del_erp:
+    if del_erp and 'erp' in dm:
         del dm.erp  # free memory
     print(f'before blink removal: {len(dm)}')
     dm = (dm.blink_latency < 0) | (dm.blink_latency > .5)
@@ -297,6 +1200,1300 @@ def filter_dm(dm, del_erp=True):
     return dm, fdm
 
 
+def group_codes(*columns):
+    """Returns integer codes for the groups that are defined by the unique
+    combinations of values in one or more columns. The groups are numbered
+    in the same order as the groups of ops.split().
+    
+    Parameters
+    ----------
+    *columns: BaseColumn or array
+    
+    Returns
+    -------
+    tuple
+        A (codes, keys) tuple, where codes is an array with a group code for
+        each row, and keys is a list with a tuple of column values for each
+        group.
+    """
+    values = [np.asarray(col) for col in columns]
+    codes = np.stack([np.unique(value, return_inverse=True)[1].ravel()
+                      for value in values], axis=1)
+    _, first, codes = np.unique(codes, axis=0, return_index=True,
+                                return_inverse=True)
+    values = [value.tolist() for value in values]
+    keys = [tuple(value[i] for value in values) for i in first]
+    return codes.ravel(), keys
+
+
+def _group_sums(values, codes, n_groups):
+    """Returns the sums and the number of non-nan values per group for an
+    array with rows on the first axis. nan values are ignored.
+    """
+    valid = ~np.isnan(values)
+    order = np.argsort(codes, kind='stable')
+    groups, starts = np.unique(codes[order], return_index=True)
+    shape = (n_groups,) + values.shape[1:]
+    sums, counts = np.zeros(shape), np.zeros(shape)
+    sums[groups] = np.add.reduceat(np.where(valid, values, 0)[order],
+                                   starts, axis=0)
+    counts[groups] = np.add.reduceat(valid[order], starts, axis=0)
+    return sums, counts
+
+
+def erg_peaks(col, codes, peak_range=ERG_PEAK_RANGE, halfwidth=2):
+    """Determines the latency of the negative ERG peak separately for each
+    group, as the minimum of the group average within peak_range, and the
+    amplitude of this peak for each trial, as the average of a window of
+    2 * halfwidth + 1 samples around the latency.
+    
+    Parameters
+    ----------
+    col: SeriesColumn
+    codes: array
+        Group codes as returned by group_codes()
+    peak_range: tuple, optional
+    halfwidth: int, optional
+    
+    Returns
+    -------
+    tuple
+        An (index, peak) tuple of arrays with the sample index of the peak of
+        the group, and the peak amplitude, for each trial.
+    """
+    start, end = peak_range
+    sums, counts = _group_sums(np.asarray(col._seq[:, start:end], dtype=float),
+                               codes, codes.max() + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    index = (np.argmin(means, axis=1) + start)[codes]
+    window = index[:, None] + np.arange(-halfwidth, halfwidth + 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        peak = np.nanmean(np.take_along_axis(col._seq, window, axis=1),
+                          axis=1)
+    return index, peak
+
+
+def group_aggregate(dm, by, **aggregations):
+    """Aggregates columns per group, where groups are defined by the unique
+    combinations of values in the by columns. This gives the same results as
+    looping through ops.split(), but all groups are reduced at once. nan
+    values are ignored, and for series columns each sample is reduced
+    separately.
+    
+    Example:
+    
+    ```
+    vdm = group_aggregate(fdm, ['subject_nr', 'intensity'],
+                          erg_std=('erg', 'std'), n=('erg', 'count'))
+    ```
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    by: list of str
+    **aggregations: tuple
+        Keywords specify the names of the resulting columns, and values are
+        (column, function) tuples, where column is a column name or a column,
+        and function is 'mean', 'std' (with ddof=1 as in datamatrix), 'sum',
+        or 'count' (the number of non-nan values).
+    
+    Returns
+    -------
+    DataMatrix
+        A DataMatrix with one row per group, sorted as for ops.split(), with
+        the by columns and the aggregated columns.
+    """
+    codes, keys = group_codes(*[dm[name] for name in by])
+    n_groups = len(keys)
+    rdm = DataMatrix(length=n_groups)
+    for i, name in enumerate(by):
+        rdm[name] = [key[i] for key in keys]
+    for name, (col, function) in aggregations.items():
+        if isinstance(col, str):
+            col = dm[col]
+        values = np.asarray(col._seq, dtype=float)
+        sums, counts = _group_sums(values, codes, n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if function == 'sum':
+                result = sums
+            elif function == 'count':
+                result = counts
+            elif function == 'mean':
+                result = sums / counts
+            elif function == 'std':
+                deviations = values - (sums / counts)[codes]
+                ss, _ = _group_sums(deviations ** 2, codes, n_groups)
+                result = np.sqrt(ss / (counts - 1))
+                result[counts < 2] = np.nan
+            else:
+                raise ValueError(f'invalid aggregation function: {function}')
+        if result.ndim == 1:
+            rdm[name] = FloatColumn
+            rdm[name] = result
+        elif result.ndim == 2:
+            rdm[name] = SeriesColumn(depth=result.shape[1])
+            rdm[name]._seq[:] = result
+        else:
+            rdm[name] = MultiDimensionalColumn(shape=result.shape[1:])
+            rdm[name]._seq[:] = result
+    return rdm
+
+
+def add_lag_features(dm, by=('subject_nr', 'session_nr'),
+                     sequence='count_trial_sequence', n_back=1,
+                     gap='trial_diff', **features):
+    """Adds features of the trial that came n_back trials earlier within the
+    same group (by default the same session) to dm. Changes dm in place.
+    Trials are ordered by the sequence column within each group. Trials
+    without an earlier trial in the group get nan values.
+    
+    Example:
+    
+    ```
+    mask = add_lag_features(fdm,
+                            previous_intensity_cdm2='intensity_cdm2',
+                            previous_pupil='mean_pupil_area')
+    ```
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    by: list of str, optional
+    sequence: str, optional
+    n_back: int, optional
+    gap: str, optional
+        The name of a column for the difference in the sequence column
+        between a trial and the earlier trial.
+    **features: str
+        Keywords specify the names of the new columns, and values specify the
+        names of the (numeric) columns that they are taken from.
+    
+    Returns
+    -------
+    array
+        A boolean array that indicates for each row whether the earlier trial
+        is exactly n_back trials earlier in the sequence, i.e. whether none of
+        the trials in between were removed.
+    """
+    codes, _ = group_codes(*[dm[name] for name in by])
+    seq = np.asarray(dm[sequence], dtype=float)
+    order = np.lexsort((seq, codes))
+    previous = np.full(len(dm), -1)
+    same_group = codes[order[n_back:]] == codes[order[:-n_back]]
+    previous[order[n_back:][same_group]] = order[:-n_back][same_group]
+    has_previous = previous >= 0
+    for name, source in features.items():
+        values = np.full(len(dm), np.nan)
+        values[has_previous] = np.asarray(dm[source],
+                                          dtype=float)[previous[has_previous]]
+        dm[name] = FloatColumn
+        dm[name] = values
+    diff = np.full(len(dm), np.nan)
+    diff[has_previous] = seq[has_previous] - seq[previous[has_previous]]
+    dm[gap] = FloatColumn
+    dm[gap] = diff
+    return diff == n_back
+
+
+def _granger_ssr(X, y):
+    """Returns the residual sum of squares of a batch of least-squares
+    problems, where X has the shape (batch, rows, columns) and y has the
+    shape (batch, rows).
+    """
+    Q, _ = np.linalg.qr(X)
+    fitted = Q @ (np.swapaxes(Q, 1, 2) @ y[..., None])
+    return np.sum((y - fitted[..., 0]) ** 2, axis=1)
+
+
+def granger_ftest(effect, cause, lags):
+    """Tests whether cause Granger-causes effect for a range of lags. This
+    gives the same F statistic as 'params_ftest' of
+    statsmodels.tsa.stattools.grangercausalitytests(), but other tests are
+    not computed, and multiple signals are fit together in a single batch of
+    least-squares problems for each lag.
+    
+    Parameters
+    ----------
+    effect: array
+        An array with the shape (samples,) or (signals, samples).
+    cause: array
+        An array with the same shape as effect.
+    lags: list of int
+    
+    Returns
+    -------
+    array
+        The F statistic for each lag, with the shape (lags,) or (signals,
+        lags).
+    """
+    effect = np.asarray(effect, dtype=float)
+    cause = np.asarray(cause, dtype=float)
+    f = np.empty(effect.shape[:-1] + (len(lags),))
+    effect, cause = effect.reshape(-1, effect.shape[-1]), \
+        cause.reshape(-1, cause.shape[-1])
+    n_signals, n = effect.shape
+    for i, lag in enumerate(lags):
+        # The lags of the signals, such that row t contains the samples
+        # t - 1, t - 2, ..., t - lag
+        own = sliding_window_view(effect, lag, axis=1)[:, :-1, ::-1]
+        other = sliding_window_view(cause, lag, axis=1)[:, :-1, ::-1]
+        const = np.ones((n_signals, n - lag, 1))
+        y = effect[:, lag:]
+        ssr_own = _granger_ssr(np.concatenate([own, const], axis=2), y)
+        ssr_joint = _granger_ssr(np.concatenate([own, other, const], axis=2),
+                                 y)
+        df_resid = n - lag - (2 * lag + 1)
+        f[..., i] = ((ssr_own - ssr_joint) / ssr_joint / lag
+                     * df_resid).reshape(f.shape[:-1])
+    return f
+
+
+def _granger_ftests(args):
+    """Computes the F statistics in both directions for a chunk of signals.
+    """
+    x1, x2, lags = args
+    return granger_ftest(x1, x2, lags), granger_ftest(x2, x1, lags)
+
+
+def granger_ftests(x1, x2, lags, n_jobs=None):
+    """Tests Granger causality in both directions for multiple signals, such
+    as the average signals of different subjects. The signals are divided
+    into chunks that are processed in parallel.
+    
+    Parameters
+    ----------
+    x1: array
+        An array with the shape (signals, samples).
+    x2: array
+        An array with the same shape as x1.
+    lags: list of int
+    n_jobs: int or None, optional
+        The number of processes, or None to use N_PROCESSES.
+    
+    Returns
+    -------
+    tuple
+        A (x2_to_x1, x1_to_x2) tuple of arrays with the shape (signals,
+        lags), where x2_to_x1 are the F statistics for the test whether x2
+        Granger-causes x1, and vice versa.
+    """
+    if n_jobs is None:
+        n_jobs = N_PROCESSES
+    x1, x2 = np.asarray(x1, dtype=float), np.asarray(x2, dtype=float)
+    chunks = np.array_split(np.arange(len(x1)), min(n_jobs, len(x1)))
+    args = [(x1[chunk], x2[chunk], list(lags)) for chunk in chunks]
+    if len(args) > 1:
+        with ProcessPoolExecutor(len(args)) as executor:
+            results = list(executor.map(_granger_ftests, args))
+    else:
+        results = [_granger_ftests(arg) for arg in args]
+    x2_to_x1, x1_to_x2 = zip(*results)
+    return np.concatenate(x2_to_x1), np.concatenate(x1_to_x2)
+
+
+def _trial_granger_ftests(args):
+    """Computes the single-trial F statistics in both directions for one
+    group of trials.
+    """
+    x1, x2, lags, chunk_size = args
+    n_samples = x1.shape[1]
+    # The sufficient statistics of the unrestricted models, in which the
+    # columns are the lags of x1, the lags of x2, and the intercept. The
+    # restricted models are subsets of these columns. Both directions share
+    # the same design, and only differ in the dependent variable.
+    XtX = [np.zeros((2 * lag + 1, 2 * lag + 1)) for lag in lags]
+    Xty = [np.zeros((2, 2 * lag + 1)) for lag in lags]
+    yty = np.zeros((len(lags), 2))
+    n_obs = np.zeros(len(lags))
+    for start in range(0, len(x1), chunk_size):
+        s1 = np.asarray(x1[start:start + chunk_size], dtype=float)
+        s2 = np.asarray(x2[start:start + chunk_size], dtype=float)
+        valid = ~(np.isnan(s1).any(axis=1) | np.isnan(s2).any(axis=1))
+        s1, s2 = s1[valid], s2[valid]
+        for i, lag in enumerate(lags):
+            X = np.concatenate([
+                sliding_window_view(s1, lag, axis=1)[:, :-1, ::-1],
+                sliding_window_view(s2, lag, axis=1)[:, :-1, ::-1],
+                np.ones((len(s1), n_samples - lag, 1))],
+                axis=2).reshape(-1, 2 * lag + 1)
+            y = np.stack([s1[:, lag:].ravel(), s2[:, lag:].ravel()])
+            XtX[i] += X.T @ X
+            Xty[i] += y @ X
+            yty[i] += np.sum(y ** 2, axis=1)
+            n_obs[i] += len(X)
+    f = np.empty((2, len(lags)))
+    for i, lag in enumerate(lags):
+        n_columns = 2 * lag + 1
+        for direction, own in enumerate((np.r_[0:lag, n_columns - 1],
+                                         np.r_[lag:2 * lag, n_columns - 1])):
+            xty = Xty[i][direction]
+            ssr_joint = yty[i, direction] - xty @ np.linalg.solve(XtX[i], xty)
+            ssr_own = yty[i, direction] - xty[own] @ np.linalg.solve(
+                XtX[i][np.ix_(own, own)], xty[own])
+            f[direction, i] = (ssr_own - ssr_joint) / ssr_joint / lag \
+                * (n_obs[i] - n_columns)
+    return f
+
+
+def trial_granger_ftests(x1, x2, codes, lags, chunk_size=EPOCH_CHUNK_SIZE,
+                         n_jobs=None):
+    """Tests Granger causality in both directions based on single trials,
+    separately for each group of trials (such as subjects). For each group,
+    the lagged regressions are fit to all trials together, with lags that
+    don't cross trial boundaries. The trials are processed in chunks of
+    chunk_size, for which only the sufficient statistics of the regressions
+    are kept, so that the lagged design matrices of all trials are never in
+    memory at once. Trials with nan values are skipped. Groups are processed
+    in parallel.
+    
+    Parameters
+    ----------
+    x1: array
+        An array with the shape (trials, samples).
+    x2: array
+        An array with the same shape as x1.
+    codes: array
+        Group codes as returned by group_codes()
+    lags: list of int
+    chunk_size: int, optional
+    n_jobs: int or None, optional
+        The number of processes, or None to use N_PROCESSES.
+    
+    Returns
+    -------
+    tuple
+        A (x2_to_x1, x1_to_x2) tuple of arrays with the shape (groups,
+        lags), like granger_ftests().
+    """
+    if n_jobs is None:
+        n_jobs = N_PROCESSES
+    lags = list(lags)
+    args = [(x1[rows], x2[rows], lags, chunk_size)
+            for rows in (np.flatnonzero(codes == code)
+                         for code in range(codes.max() + 1))]
+    if n_jobs > 1 and len(args) > 1:
+        with ProcessPoolExecutor(min(n_jobs, len(args))) as executor:
+            results = list(executor.map(_trial_granger_ftests, args))
+    else:
+        results = [_trial_granger_ftests(arg) for arg in args]
+    x2_to_x1, x1_to_x2 = np.stack(results, axis=1)
+    return x2_to_x1, x1_to_x2
+
+
+def window_averages(columns, starts, width, chunk_size=EPOCH_CHUNK_SIZE):
+    """Averages multidimensional columns with a (trials, channels, samples)
+    shape over trials and windows of samples, such as for topomaps. Each
+    column is read only once, in chunks of trials, after which the window
+    averages are taken from the cumulative sum over samples. nan values are
+    ignored, as when averaging with column[:, :, start:end][..., :, ...].
+    
+    Parameters
+    ----------
+    columns: list of MultiDimensionalColumn
+    starts: array
+        The first sample of each window. Windows can overlap.
+    width: int or array
+        The number of samples in each window.
+    chunk_size: int, optional
+    
+    Returns
+    -------
+    array
+        An array with the shape (windows, channels), where the channels of
+        all columns are concatenated.
+    """
+    starts = np.asarray(starts)
+    averages = []
+    for col in columns:
+        seq = col._seq
+        ends = np.minimum(starts + width, seq.shape[-1])
+        sums = np.zeros(seq.shape[1:])
+        counts = np.zeros(seq.shape[1:])
+        for start in range(0, len(seq), chunk_size):
+            chunk = np.asarray(seq[start:start + chunk_size], dtype=float)
+            valid = ~np.isnan(chunk)
+            sums += np.where(valid, chunk, 0).sum(axis=0)
+            counts += valid.sum(axis=0)
+        padding = [(0, 0)] * (sums.ndim - 1) + [(1, 0)]
+        sums = np.pad(np.cumsum(sums, axis=-1), padding)
+        counts = np.pad(np.cumsum(counts, axis=-1), padding)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages.append((sums[..., ends] - sums[..., starts])
+                            / (counts[..., ends] - counts[..., starts]))
+    return np.concatenate(averages, axis=0).T
+
+
+def _channel_info(info):
+    """Extracts the channel information that is stored by get_merged_data()
+    from an mne.Info object.
+    """
+    eeg = mne.pick_types(info, eeg=True)
+    eog = mne.pick_types(info, eeg=False, eog=True)
+    topomap_pos = _find_topomap_coords(info, eeg)
+    return {
+        'sfreq': info['sfreq'],
+        'channels': [{'name': ch['ch_name'],
+                      'type': mne.channel_type(info, i),
+                      'pos': ch['loc'][:3].tolist()}
+                     for i, ch in enumerate(info['chs'])],
+        'columns': {'erp': [info.ch_names[i] for i in eeg],
+                    'eog': [info.ch_names[i] for i in eog]},
+        'topomap_pos': {info.ch_names[i]: pos.tolist()
+                        for i, pos in zip(eeg, topomap_pos)}
+    }
+
+
+def _write_channel_info(channel_info):
+    """Writes channel information, as returned by _channel_info(), to
+    CHANNEL_INFO_PATH.
+    """
+    CHANNEL_INFO_PATH.parent.mkdir(parents=True, exist_ok=True)
+    CHANNEL_INFO_PATH.write_text(json.dumps(channel_info, indent=1))
+
+
+def _restore_channel_info(path):
+    """Copies channel information that was stored alongside cached data to
+    CHANNEL_INFO_PATH, unless CHANNEL_INFO_PATH already exists or path
+    doesn't exist.
+    """
+    if CHANNEL_INFO_PATH.exists() or not path.exists():
+        return
+    CHANNEL_INFO_PATH.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(path, CHANNEL_INFO_PATH)
+
+
+def read_channel_info():
+    """Returns information about the channels, as stored in
+    CHANNEL_INFO_PATH by get_merged_data(). If this file doesn't exist, and
+    get_merged_data() could not create it from the cached data, it is
+    created from the raw data of the first subject.
+    
+    Returns
+    -------
+    dict
+        A dict with the sampling rate (sfreq), the name, type, and position of
+        each channel (channels), the channel names of the erp and eog columns
+        (columns), and the two-dimensional topomap coordinates of the EEG
+        channels (topomap_pos).
+    """
+    if not CHANNEL_INFO_PATH.exists():
+        raw, events, metadata = read_subject(SUBJECTS[0])
+        _write_channel_info(_channel_info(raw.info))
+    return json.loads(CHANNEL_INFO_PATH.read_text())
+
+
+def eeg_topomap_coords():
+    """Returns the two-dimensional topomap coordinates of the EEG channels,
+    in the order of the erp column.
+    
+    Returns
+    -------
+    array
+        An array with the shape (channels, 2).
+    """
+    channel_info = read_channel_info()
+    return np.array([channel_info['topomap_pos'][name]
+                     for name in channel_info['columns']['erp']])
+
+
+def topomap_interpolation(pos, res=64):
+    """Prepares the interpolation of channel values to the image of a
+    topomap in the same way as mne.viz.plot_topomap() does with its default
+    settings. The interpolation is linear in the channel values, so that it
+    can be expressed as a matrix, which is computed once for a sensor layout
+    by interpolating each channel separately.
+    
+    Parameters
+    ----------
+    pos: array
+        An array with the shape (channels, 2).
+    res: int, optional
+    
+    Returns
+    -------
+    dict
+        A dict with the positions, head outlines, and image grid, and an
+        interpolation matrix with the shape (res, res, channels).
+    """
+    sphere = mne_topomap._check_sphere(None)
+    outlines = mne_topomap._make_head_outlines(sphere, pos, 'head', (0., 0.))
+    extent, Xi, Yi, interp = mne_topomap._setup_interp(
+        pos, res, 'cubic', 'head', outlines, 'mean')
+    interp.set_locations(Xi, Yi)
+    matrix = np.stack([interp.set_values(values)()
+                       for values in np.eye(len(pos))], axis=-1)
+    return {'pos': pos, 'outlines': outlines, 'extent': extent, 'Xi': Xi,
+            'Yi': Yi, 'matrix': matrix}
+
+
+def _render_topomap(args):
+    """Renders a single topomap image to a file. This uses a bare matplotlib
+    figure, so that it works in worker processes regardless of the backend.
+    The image is drawn as by mne.viz.plot_topomap() with its default
+    settings, and clipped to the head as for extrapolate='head'. Only mne
+    helpers that exist in the version in environment.yaml are used.
+    """
+    image, interpolation, title, vlim, path = args
+    pos, outlines = interpolation['pos'], interpolation['outlines']
+    fig = mpl.figure.Figure()
+    ax = fig.add_subplot()
+    mne_topomap._prepare_topomap(pos, ax)
+    im = ax.imshow(image, cmap='RdBu_r', origin='lower', aspect='equal',
+                   extent=interpolation['extent'], interpolation='bilinear',
+                   vmin=vlim[0], vmax=vlim[1], zorder=1)
+    cont = None
+    if not ((image == image[0, 0]) | np.isnan(image)).all():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            cont = ax.contour(interpolation['Xi'], interpolation['Yi'], image,
+                              6, colors='k', linewidths=.5, zorder=2)
+    clip_radius = outlines['clip_radius']
+    head_patch = mpl.patches.Ellipse(
+        outlines.get('clip_origin', (0., 0.)), 2 * clip_radius[0],
+        2 * clip_radius[1], clip_on=True, transform=ax.transData)
+    im.set_clip_path(head_patch)
+    if cont is not None:
+        cont.set_clip_path(head_patch)
+    mne_topomap._topomap_plot_sensors(*pos.T, sensors=True, ax=ax)
+    mne_topomap._draw_outlines(ax, outlines)
+    ax.set_title(title)
+    fig.savefig(path)
+
+
+def render_topomaps(data, pos, paths, titles=None, vlim=None, n_jobs=None):
+    """Renders a series of topomaps, such as for a series of time windows,
+    and saves them to file. The images of all topomaps are interpolated at
+    once with a single matrix product, and the figures are rendered in
+    parallel.
+    
+    Parameters
+    ----------
+    data: array
+        An array with the shape (topomaps, channels).
+    pos: array
+        An array with the shape (channels, 2).
+    paths: list
+        A path for each topomap.
+    titles: list or None, optional
+    vlim: tuple or None, optional
+        The color limits, or None to use the limits of all data.
+    n_jobs: int or None, optional
+        The number of processes, or None to use N_PROCESSES.
+    """
+    if n_jobs is None:
+        n_jobs = N_PROCESSES
+    if titles is None:
+        titles = [''] * len(data)
+    if vlim is None:
+        vlim = np.nanmin(data), np.nanmax(data)
+    interpolation = topomap_interpolation(pos)
+    images = np.moveaxis(interpolation['matrix'] @ np.asarray(data).T, -1, 0)
+    args = [(image, interpolation, title, vlim, path)
+            for image, title, path in zip(images, titles, paths)]
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            list(executor.map(_render_topomap, args))
+    else:
+        for arg in args:
+            _render_topomap(arg)
+
+
+def _smooth_rows(a, winlen=11):
+    """Smooths each row of an array with a hanning window, like
+    srs.smooth().
+    """
+    d = (winlen - 1) // 2
+    window = np.hanning(winlen)
+    padded = np.pad(a, [(0, 0), (d, d)], mode='reflect')
+    return sliding_window_view(padded, winlen, axis=1) @ (window
+                                                          / window.sum())
+
+
+def _runs(mask, min_length):
+    """Returns the rows, starts, and ends of runs of True values in a
+    two-dimensional boolean array that are at least min_length long.
+    """
+    edges = np.diff(np.pad(mask.astype(np.int8), [(0, 0), (1, 1)]), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    long_enough = ends - starts >= min_length
+    return rows[long_enough], starts[long_enough], ends[long_enough]
+
+
+def gaze_kinematics(gaze_x, gaze_y, end=150, sfreq=1000, winlen=11,
+                    threshold=6, min_duration=.006,
+                    chunk_size=EPOCH_CHUNK_SIZE):
+    """Computes per-trial summaries of eye movements from the first samples
+    of gaze position. The trials are processed in chunks, and only the
+    summaries are kept. Microsaccades are detected as in Engbert and Kliegl
+    (2003), based on a five-sample velocity estimate and an elliptic
+    threshold of a multiple of the median-based standard deviation of the
+    velocity, separately for each trial. The other measures are based on
+    gaze position that has been smoothed as with srs.smooth().
+    
+    Parameters
+    ----------
+    gaze_x: SeriesColumn
+    gaze_y: SeriesColumn
+    end: int, optional
+        The number of samples from the start of the trial that are used.
+    sfreq: float, optional
+    winlen: int, optional
+        The length of the smoothing window.
+    threshold: float, optional
+        The velocity threshold for microsaccades as a multiple of the
+        standard deviation.
+    min_duration: float, optional
+        The minimum duration of microsaccades in seconds.
+    chunk_size: int, optional
+    
+    Returns
+    -------
+    dict
+        A dict with per-trial arrays for the mean gaze velocity
+        (mean_gaze_vel, in units per second), the mean gaze acceleration
+        (mean_gaze_acc, in units per second squared), the number of
+        microsaccades (microsaccade_count), and the distance that gaze
+        drifted outside of microsaccades (drift_amplitude).
+    """
+    n_trials = len(gaze_x)
+    results = {name: np.full(n_trials, np.nan)
+               for name in GAZE_KINEMATICS_COLUMNS}
+    min_samples = int(round(min_duration * sfreq))
+    for start in range(0, n_trials, chunk_size):
+        # A few samples more than needed are read, so that smoothing gives
+        # the same result as smoothing the full series
+        x = np.asarray(gaze_x._seq[start:start + chunk_size, :end + winlen],
+                       dtype=float)
+        y = np.asarray(gaze_y._seq[start:start + chunk_size, :end + winlen],
+                       dtype=float)
+        item = slice(start, start + len(x))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            # Velocity and acceleration of the smoothed gaze position
+            dx = np.diff(_smooth_rows(x, winlen)[:, :end], axis=1)
+            dy = np.diff(_smooth_rows(y, winlen)[:, :end], axis=1)
+            x, y = x[:, :end], y[:, :end]
+            results['mean_gaze_vel'][item] = np.nanmean(
+                np.hypot(dx, dy), axis=1) * sfreq
+            results['mean_gaze_acc'][item] = np.nanmean(
+                np.hypot(np.diff(dx, axis=1), np.diff(dy, axis=1)),
+                axis=1) * sfreq ** 2
+            # Microsaccade detection based on the unsmoothed gaze position
+            vx = (x[:, 4:] + x[:, 3:-1] - x[:, 1:-3] - x[:, :-4]) / 6
+            vy = (y[:, 4:] + y[:, 3:-1] - y[:, 1:-3] - y[:, :-4]) / 6
+            sd_x = np.sqrt(np.nanmedian(vx ** 2, axis=1)
+                           - np.nanmedian(vx, axis=1) ** 2)
+            sd_y = np.sqrt(np.nanmedian(vy ** 2, axis=1)
+                           - np.nanmedian(vy, axis=1) ** 2)
+            saccadic = (vx / (threshold * sd_x[:, None])) ** 2 \
+                + (vy / (threshold * sd_y[:, None])) ** 2 > 1
+        rows, starts, ends = _runs(saccadic, min_samples)
+        count = np.bincount(rows, minlength=len(x)).astype(float)
+        count[np.isnan(vx).all(axis=1)] = np.nan
+        results['microsaccade_count'][item] = count
+        # Drift is the net displacement of the smoothed gaze position
+        # during samples that are not part of a microsaccade. The
+        # five-sample velocity at index i is centered on sample i + 2.
+        edges = np.zeros((len(x), dx.shape[1] + 1))
+        np.add.at(edges, (rows, starts + 2), 1)
+        np.add.at(edges, (rows, np.minimum(ends + 2, dx.shape[1])), -1)
+        drift = np.cumsum(edges, axis=1)[:, :-1] == 0
+        results['drift_amplitude'][item] = np.hypot(
+            np.nansum(np.where(drift, dx, 0), axis=1),
+            np.nansum(np.where(drift, dy, 0), axis=1))
+        results['drift_amplitude'][item][np.isnan(dx).all(axis=1)] = np.nan
+    return results
+
+
+def _lmer_design(dm, formula, groups, winlen=1):
+    """Prepares a sample-by-sample linear mixed-effects analysis. Everything
+    that doesn't depend on the values of the predictors is computed here, so
+    that the design can be reused for many permutations of the predictors.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    formula: str
+    groups: str or None
+    winlen: int, optional
+    
+    Returns
+    -------
+    dict
+    """
+    dv, rhs = formula.split('~', 1)
+    dv = dv.strip()
+    predictors = [term for term in tst._terms(formula)[1:] if term in dm]
+    data = {term: np.asarray(dm[term]) for term in predictors}
+    design_info = patsy.dmatrix(rhs, data, NA_action='raise').design_info
+    if groups is None:
+        codes = np.zeros(len(dm), dtype=int)
+    else:
+        _, codes = np.unique(np.asarray(dm[groups]), return_inverse=True)
+    # The dependent variable is averaged over windows of winlen samples
+    y = np.asarray(dm[dv]._seq, dtype=float)
+    depth = y.shape[1]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        y = np.stack([np.nanmean(y[:, start:start + winlen], axis=1)
+                      for start in range(0, depth, winlen)], axis=1)
+    # Windows with the same missing values are fit together. For each of
+    # these patterns, the group structure and the sums of the dependent
+    # variable are computed once.
+    n_effects = len(design_info.column_names)
+    valid = ~np.isnan(y)
+    patterns, pattern_index = np.unique(valid, axis=1, return_inverse=True)
+    fits = []
+    for i, rows in enumerate(patterns.T):
+        if rows.sum() <= n_effects:
+            continue
+        samples = np.flatnonzero(pattern_index.ravel() == i)
+        group_matrix = (codes[rows] == np.unique(codes[rows])[:, None])
+        group_matrix = group_matrix.astype(float)
+        pattern_y = y[rows][:, samples]
+        fits.append({'rows': rows, 'samples': samples,
+                     'groups': group_matrix, 'n': group_matrix.sum(axis=1),
+                     'y': pattern_y, 'U': group_matrix @ pattern_y,
+                     'yty': np.sum(pattern_y ** 2, axis=0)})
+    return {'design_info': design_info, 'data': data, 'codes': codes,
+            'groups': groups, 'depth': depth, 'winlen': winlen,
+            'n_windows': y.shape[1], 'fits': fits}
+
+
+def _lmer_design_matrix(design, data):
+    """Builds the design matrix of the fixed effects from (possibly permuted)
+    predictors.
+    """
+    return np.asarray(patsy.build_design_matrices([design['design_info']],
+                                                  data)[0])
+
+
+def _lmer_fit(design, X, reml=True):
+    """Fits a sample-by-sample analysis for a batch of design matrices at
+    once.
+    
+    Parameters
+    ----------
+    design: dict
+        As returned by _lmer_design()
+    X: array
+        A batch of design matrices with the shape (batch, rows, effects)
+    reml: bool, optional
+    
+    Returns
+    -------
+    tuple
+        A (est, se, df) tuple, where est and se have the shape (batch,
+        windows, effects) and df are the residual degrees of freedom of each
+        window.
+    """
+    shape = X.shape[0], design['n_windows'], X.shape[2]
+    est, se = np.full(shape, np.nan), np.full(shape, np.nan)
+    df = np.full(design['n_windows'], np.nan)
+    for fit in design['fits']:
+        Xr = X[:, fit['rows']]
+        S = fit['groups'] @ Xr
+        XtX = np.swapaxes(Xr, 1, 2) @ Xr
+        Xty = np.swapaxes(Xr, 1, 2) @ fit['y']
+        est[:, fit['samples']], se[:, fit['samples']] = _lmer_solve(
+            fit['n'], S, XtX, Xty, fit['U'], fit['yty'], reml=reml,
+            random_intercept=design['groups'] is not None)
+        df[fit['samples']] = fit['rows'].sum() - X.shape[2]
+    return est, se, df
+
+
+def _lmer_pvalues(design, z, df):
+    """Returns p-values for z-values as returned by _lmer_fit(). These are
+    based on the t distribution for ordinary least squares, and on the normal
+    distribution for mixed-effects models, like in statsmodels.
+    """
+    if design['groups'] is None:
+        return 2 * t_dist.sf(np.abs(z), df[:, None])
+    return 2 * norm.sf(np.abs(z))
+
+
+def _expand_windows(design, value):
+    """Expands values per window, with windows on the second-to-last axis, to
+    values per sample on the last axis.
+    """
+    value = np.repeat(value, design['winlen'], axis=-2)[..., :design['depth'], :]
+    return np.swapaxes(value, -1, -2)
+
+
+def _lmer_profile(lam, n, S, XtX, Xty, U, yty, fac, reml):
+    """Evaluates the log-likelihood of a random-intercept model, with the
+    fixed effects and the residual variance profiled out, for a batch of
+    models. lam is the random-intercept variance relative to the residual
+    variance, with the shape (batch, samples). The other arguments are the
+    sufficient statistics of the fixed effects (S, XtX, Xty), which have a
+    leading batch dimension, and of the dependent variable (U, yty).
+    """
+    # The inverse of the covariance matrix of a group is I - c * 11', which
+    # means that everything can be expressed in terms of group sums
+    w = 1 / (1 + lam[..., None] * n)
+    c = lam[..., None] * w
+    M = XtX[:, None] - np.einsum('btg,bgi,bgj->btij', c, S, S)
+    Xvy = np.swapaxes(Xty, 1, 2) - np.einsum('btg,bgi,gt->bti', c, S, U)
+    yvy = yty - np.einsum('btg,gt->bt', c, U ** 2)
+    beta = np.linalg.solve(M, Xvy[..., None])[..., 0]
+    rvr = yvy - np.sum(Xvy * beta, axis=-1)
+    ll = np.sum(np.log1p(lam[..., None] * n), axis=-1) + fac * np.log(rvr)
+    if reml:
+        ll += np.linalg.slogdet(M)[1]
+    return -.5 * ll, w, M, beta, rvr
+
+
+def _lmer_solve(n, S, XtX, Xty, U, yty, reml=True, random_intercept=True,
+                iterations=60):
+    """Fits random-intercept models for a batch of designs and all samples at
+    once. The random-intercept variance is first estimated on LAMBDA_GRID and
+    then refined with a golden-section search, after which the standard
+    errors are derived from the Hessian of the profile log-likelihood in the
+    same way as by statsmodels' MixedLM.
+    
+    Parameters
+    ----------
+    n: array
+        The number of observations per group
+    S: array
+        The sums of the design matrices per group, with the shape (batch,
+        groups, effects)
+    XtX: array
+        The cross products of the design matrices, with the shape (batch,
+        effects, effects)
+    Xty: array
+        The cross products of the design matrices and the dependent variable,
+        with the shape (batch, effects, samples)
+    U: array
+        The sums of the dependent variable per group, with the shape (groups,
+        samples)
+    yty: array
+        The sums of squares of the dependent variable
+    reml: bool, optional
+    random_intercept: bool, optional
+        If False, ordinary least squares is used instead.
+    iterations: int, optional
+        The number of iterations of the golden-section search.
+    
+    Returns
+    -------
+    tuple
+        An (est, se) tuple of arrays with the shape (batch, samples, effects)
+    """
+    n_obs, n_effects = n.sum(), S.shape[2]
+    fac = n_obs - n_effects if reml or not random_intercept else n_obs
+    args = n, S, XtX, Xty, U, yty, fac, reml
+    shape = Xty.shape[0], Xty.shape[2]
+    if random_intercept:
+        ll = np.array([_lmer_profile(np.full(shape, lam), *args)[0]
+                       for lam in LAMBDA_GRID])
+        best = np.argmax(ll, axis=0)
+        lam = LAMBDA_GRID[best]
+        lo = LAMBDA_GRID[np.maximum(best - 1, 0)]
+        hi = LAMBDA_GRID[np.minimum(best + 1, len(LAMBDA_GRID) - 1)]
+        ratio = (np.sqrt(5) - 1) / 2
+        c, d = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        fc, fd = _lmer_profile(c, *args)[0], _lmer_profile(d, *args)[0]
+        for i in range(iterations):
+            left = fc > fd
+            hi = np.where(left, d, hi)
+            lo = np.where(left, lo, c)
+            point = np.where(left, hi - ratio * (hi - lo),
+                             lo + ratio * (hi - lo))
+            fpoint = _lmer_profile(point, *args)[0]
+            c, d, fc, fd = np.where(left, point, d), np.where(left, c, point), \
+                np.where(left, fpoint, fd), np.where(left, fc, fpoint)
+        # The grid value is kept if it's better, which can happen when the
+        # estimate is on the boundary
+        refined = np.where(fc > fd, c, d)
+        lam = np.where(np.maximum(fc, fd) > np.max(ll, axis=0), refined, lam)
+    else:
+        lam = np.zeros(shape)
+    _, w, M, beta, rvr = _lmer_profile(lam, *args)
+    scale = rvr / fac
+    Minv = np.linalg.inv(M)
+    if not random_intercept:
+        cov = scale[..., None, None] * Minv
+        return beta, np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+    # The Hessian with respect to the fixed effects (fe) and the relative
+    # random-intercept variance (re), following MixedLM.hessian(). Residuals
+    # enter only through their group sums.
+    e = U.T - np.einsum('bgi,bti->btg', S, beta)
+    b = e * w
+    hess_fere = -np.einsum('bgi,btg->bti', S, b * w) / scale[..., None]
+    B = np.sum(b ** 2, axis=-1)
+    D = np.sum(2 * n * b ** 2 * w, axis=-1)
+    hess_re = np.sum(n ** 2 * w ** 2, axis=-1) / 2 \
+        - .5 * fac * (D / rvr - B ** 2 / rvr ** 2)
+    if reml:
+        a = S[:, None] * w[..., None]
+        xtax = np.einsum('btgi,btgj->btij', a, a)
+        F = np.einsum('btg,btgi,btgj->btij', 2 * n * w, a, a)
+        QL = Minv @ xtax
+        hess_re += .5 * (np.einsum('btij,btji->bt', QL, QL)
+                         - np.einsum('btij,btji->bt', Minv, F))
+    # The covariance of the fixed effects is the corresponding block of the
+    # inverse of the negative Hessian, i.e. the inverse of a Schur complement
+    A = M / scale[..., None, None]
+    cov = np.linalg.inv(A - np.einsum('bti,btj->btij', hess_fere, hess_fere)
+                        / -hess_re[..., None, None])
+    return beta, np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+
+
+def fast_lmer_series(dm, formula, groups=None, winlen=1, reml=True):
+    """Performs a sample-by-sample linear mixed-effects analysis with a random
+    intercept per group, like tst.lmer_series(). Rather than fitting a model
+    for each sample separately, all samples are fit at once, because they
+    share the design and grouping structure. Samples with the same missing
+    values are fit together.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    formula: str
+    groups: str or None, optional
+        If None, ordinary least squares is used.
+    winlen: int, optional
+    reml: bool, optional
+    
+    Returns
+    -------
+    DataMatrix
+        A DataMatrix with one row per effect and est, se, z, and p series
+        columns, like tst.lmer_series().
+    """
+    design = _lmer_design(dm, formula, groups, winlen)
+    X = _lmer_design_matrix(design, design['data'])
+    est, se, df = _lmer_fit(design, X[None], reml=reml)
+    z = est / se
+    p = _lmer_pvalues(design, z, df)
+    rm = DataMatrix(length=X.shape[1])
+    rm.effect = design['design_info'].column_names
+    for name, value in (('p', p), ('z', z), ('est', est), ('se', se)):
+        rm[name] = SeriesColumn(depth=design['depth'])
+        rm[name]._seq[:] = _expand_windows(design, value[0])
+    return rm
+
+
+# The data of a permutation test in a worker process, as set by
+# _init_permutation_worker()
+_permutation_state = None
+
+
+def _data_hash(dm):
+    """Returns a sha1 hash of the contents of a DataMatrix."""
+    sha1 = hashlib.sha1()
+    for name, col in dm.columns:
+        sha1.update(name.encode())
+        if isinstance(col._seq, np.ndarray):
+            sha1.update(np.ascontiguousarray(col._seq).tobytes())
+        else:
+            sha1.update(json.dumps(_json_safe(col._seq)).encode())
+    return sha1.hexdigest()
+
+
+def _replace_text(path, text):
+    """Writes text to a temporary file first, and then replaces path, so that
+    a crash doesn't leave behind an incomplete file.
+    """
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(text)
+    tmp_path.replace(path)
+
+
+def _permuted_index(rng, group_index):
+    """Returns an index that shuffles rows within groups."""
+    index = np.arange(sum(len(rows) for rows in group_index))
+    for rows in group_index:
+        index[rows] = rng.permutation(rows)
+    return index
+
+
+def _lmer_clusters(dm, formula, groups, winlen, cluster_p_threshold, reml):
+    """Runs a sample-by-sample linear mixed-effects analysis and returns the
+    clusters as a dict with effects as keys and lists of (start, end, zsum)
+    tuples as values, sorted by zsum.
+    """
+    rm = fast_lmer_series(dm, formula, groups=groups, winlen=winlen,
+                          reml=reml)
+    return {effect: [(int(start), int(end), float(zsum))
+                     for start, end, zsum in clusters]
+            for effect, clusters in
+            tst._clusters(rm, cluster_p_threshold).items()}
+
+
+def _largest_clusters(z, p, cluster_p_threshold):
+    """Returns the zsum of the largest cluster for each row of z and p,
+    where clusters are defined as in tst._clusters(): consecutive samples
+    with a p-value below the threshold and z-values with the same sign.
+    Samples are on the last axis.
+    """
+    shape, depth = z.shape[:-1], z.shape[-1]
+    z = z.reshape(-1, depth)
+    index = np.flatnonzero(p.reshape(-1, depth) < cluster_p_threshold)
+    largest = np.zeros(len(z))
+    if not len(index):
+        return largest.reshape(shape)
+    row = index // depth
+    z = z.ravel()[index]
+    start = np.r_[True, (np.diff(index) != 1) | (np.diff(row) != 0)
+                  | (z[1:] * z[:-1] < 0)]
+    zsum = np.abs(np.bincount(np.cumsum(start) - 1, weights=z))
+    np.maximum.at(largest, row[start], zsum)
+    return largest.reshape(shape)
+
+
+def _init_permutation_worker(dm, formula, groups, winlen, cluster_p_threshold,
+                             reml, seed):
+    """Initializes a worker process with the data of a permutation test. The
+    design is prepared only once per process, and only the predictors are
+    permuted afterwards.
+    """
+    global _permutation_state
+    design = _lmer_design(dm, formula, groups, winlen)
+    group_index = [np.flatnonzero(design['codes'] == code)
+                   for code in np.unique(design['codes'])]
+    _permutation_state = design, cluster_p_threshold, reml, seed, group_index
+
+
+def _run_permutations(iterations):
+    """Runs a batch of permutations in a worker process and returns the zsum
+    of the largest cluster of each effect for each permutation. Each
+    predictor is shuffled independently within groups with a random
+    generator that depends only on the seed and the iteration, so that the
+    result doesn't depend on which process or batch runs the iteration. All
+    permutations of a batch are fit together.
+    """
+    design, cluster_p_threshold, reml, seed, group_index = _permutation_state
+    X = []
+    for iteration in iterations:
+        rng = np.random.default_rng([seed, iteration])
+        data = {term: value[_permuted_index(rng, group_index)]
+                for term, value in design['data'].items()}
+        X.append(_lmer_design_matrix(design, data))
+    est, se, df = _lmer_fit(design, np.stack(X), reml=reml)
+    z = est / se
+    p = _lmer_pvalues(design, z, df)
+    largest = _largest_clusters(_expand_windows(design, z),
+                                _expand_windows(design, p),
+                                cluster_p_threshold)
+    effects = design['design_info'].column_names
+    return [dict(zip(effects, map(float, zsum))) for zsum in largest]
+
+
+def permutation_test(dm, formula, name, groups='subject_nr', winlen=1,
+                     iterations=None, cluster_p_threshold=.05,
+                     test_intercept=False, reml=True, seed=0,
+                     n_jobs=None, sequential=False, sequential_error=.001):
+    """Performs a cluster-based permutation test based on sample-by-sample
+    linear mixed-effects analyses, like tst.lmer_permutation_test(), but
+    with the models fit by fast_lmer_series(). The design is prepared once,
+    and the permutations are fit in batches of PERMUTATION_BATCH_SIZE, which
+    are distributed across worker processes. Each completed permutation is
+    stored in PERMUTATION_FOLDER, so that an interrupted test resumes where
+    it stopped. The results are written to FOLDER_RESULTS as {name}.json.
+    
+    The permutation scheme differs from tst.lmer_permutation_test(), which
+    shuffles the dependent variable and each predictor within groups with
+    Python's unseeded random module. Here, only the predictors are shuffled,
+    each independently within groups, with a numpy generator that is seeded
+    by (seed, iteration). This results in the same permutation distribution,
+    because shuffling the dependent variable as well only changes the order
+    of the rows. However, the hit proportions are not identical to those of
+    tst.lmer_permutation_test(), and can only be compared within the error
+    that results from the limited number of permutations. The observed
+    clusters are based on fast_lmer_series() rather than tst.lmer_series(),
+    which differ where statsmodels doesn't converge. See
+    analyze_reported_clusters.py for a comparison with the reported results.
+    For a given seed, the results are reproducible regardless of the number
+    of processes.
+    
+    In sequential mode, the test can stop early after the fractions of the
+    permutations that are given by SEQUENTIAL_LOOKS. It stops when the
+    p-value of each cluster is known relative to CLUSTER_P_THRESHOLDS. This is
+    the case when none of the thresholds falls within the Clopper-Pearson
+    confidence interval of the p-value. The error is divided over the looks,
+    so that the probability that a cluster ends up on the wrong side of a
+    threshold is at most sequential_error. Otherwise, all permutations are
+    run. Sequential mode is therefore never slower than the full test. It is
+    only faster when the p-values of all clusters are clearly above or below
+    the thresholds. A p-value close to zero cannot be resolved relative to
+    .001 with 1000 permutations, so a test with such a cluster runs all
+    permutations.
+    
+    Parameters
+    ----------
+    dm: DataMatrix
+    formula: str
+    name: str
+        A name that identifies the test.
+    groups: str or None, optional
+    winlen: int, optional
+    iterations: int or None, optional
+        The number of permutations, or None to use PERMUTATION_ITERATIONS.
+        In sequential mode, this is the maximum number of permutations.
+    cluster_p_threshold: float, optional
+    test_intercept: bool, optional
+        Indicates whether clusters in the intercept are sufficient to run the
+        permutations.
+    reml: bool, optional
+    seed: int, optional
+        The seed of the random permutations.
+    n_jobs: int or None, optional
+        The number of worker processes, or None to use N_PROCESSES.
+    sequential: bool, optional
+        Indicates whether the test stops early when the p-values are known
+        relative to CLUSTER_P_THRESHOLDS.
+    sequential_error: float, optional
+        The maximum probability of a wrong decision per cluster in sequential
+        mode.
+    
+    Returns
+    -------
+    dict
+        A dict with effects as keys and lists of (start, end, zsum, hit
+        proportion) tuples as values, like tst.lmer_permutation_test(). The
+        p-value is 1 - hit proportion, where the hit proportion is based on
+        the permutations that were actually run.
+    """
+    if iterations is None:
+        iterations = PERMUTATION_ITERATIONS
+    if n_jobs is None:
+        n_jobs = N_PROCESSES
+    dm = tst._trim_dm(dm, formula, groups, None)
+    config = {'formula': formula, 'groups': groups, 'winlen': winlen,
+              'cluster_p_threshold': cluster_p_threshold,
+              'reml': reml, 'seed': seed, 'permuted': 'predictors',
+              'data': _data_hash(dm)}
+    # Completed permutations are stored as one line per permutation. The
+    # first line contains the configuration and the observed clusters, and
+    # completed permutations are discarded when the configuration changes.
+    PERMUTATION_FOLDER.mkdir(parents=True, exist_ok=True)
+    progress_path = PERMUTATION_FOLDER / f'{name}.jsonl'
+    completed = {}
+    cluster_obs = None
+    if progress_path.exists():
+        lines = progress_path.read_text().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            # An unreadable header is treated as stale, and the test starts
+            # over
+            header = {}
+        if header.get('config') == config:
+            cluster_obs = header['clusters']
+            valid_lines = lines[:1]
+            for line in lines[1:]:
+                try:
+                    permutation = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line is incomplete if the test was killed
+                    continue
+                completed[permutation['iteration']] = permutation['zsum']
+                valid_lines.append(line)
+            _replace_text(progress_path, '\n'.join(valid_lines) + '\n')
+            logger.info(f'resuming {name} with {len(completed)} permutations')
+    if cluster_obs is None:
+        cluster_obs = _lmer_clusters(dm, formula, groups, winlen,
+                                     cluster_p_threshold, reml)
+        _replace_text(progress_path, json.dumps(
+            {'config': config, 'clusters': cluster_obs}) + '\n')
+    logger.info(f'observed clusters: {cluster_obs}')
+    # If there are no clusters, the permutations are skipped. The intercept
+    # usually has clusters that we're not interested in.
+    tested = {effect: clusters for effect, clusters in cluster_obs.items()
+              if effect != 'Intercept' or test_intercept}
+    # The number of permutations after which a sequential test can stop
+    looks = sorted({int(round(fraction * iterations))
+                    for fraction in SEQUENTIAL_LOOKS} if sequential else ())
+    looks = [look for look in looks if 0 < look < iterations]
+    
+    def stopping_point():
+        # Returns the number of permutations on which the results are based,
+        # or None if more permutations are needed. Only the first permutations
+        # are taken into account, so that the decision doesn't depend on the
+        # order in which batches finish.
+        n = next((i for i in range(iterations) if i not in completed),
+                 iterations)
+        if n == iterations:
+            return n
+        looks_done = [look for look in looks if look <= n]
+        if not looks_done:
+            return None
+        look = looks_done[-1]
+        alpha = sequential_error / len(looks)
+        for effect, clusters in tested.items():
+            null = np.array([completed[i][effect] for i in range(look)])
+            for start, end, zsum in clusters:
+                k = np.sum(null >= zsum)
+                lower = beta_dist.ppf(alpha / 2, k, look - k + 1) if k else 0
+                upper = beta_dist.ppf(1 - alpha / 2, k + 1, look - k) \
+                    if k < look else 1
+                if any(lower <= threshold <= upper
+                       for threshold in CLUSTER_P_THRESHOLDS):
+                    return None
+        return look
+    
+    if not any(tested.values()):
+        logger.info('no clusters reach threshold, skipping test')
+    elif stopping_point() is None:
+        remaining = [iteration for iteration in range(iterations)
+                     if iteration not in completed]
+        batches = [remaining[i:i + PERMUTATION_BATCH_SIZE]
+                   for i in range(0, len(remaining), PERMUTATION_BATCH_SIZE)]
+        initargs = dm, formula, groups, winlen, cluster_p_threshold, \
+            reml, seed
+        with progress_path.open('a') as fd:
+            def store(batch, zsums):
+                for iteration, zsum in zip(batch, zsums):
+                    completed[iteration] = zsum
+                    fd.write(json.dumps({'iteration': iteration,
+                                         'zsum': zsum}) + '\n')
+                fd.flush()
+                logger.info(f'{name}: permutation {len(completed)} of '
+                            f'{iterations}')
+                return stopping_point() is not None
+            
+            if n_jobs > 1 and len(batches) > 1:
+                with ProcessPoolExecutor(
+                        min(n_jobs, len(batches)),
+                        initializer=_init_permutation_worker,
+                        initargs=initargs) as executor:
+                    for batch, zsums in zip(
+                            batches, executor.map(_run_permutations, batches)):
+                        if store(batch, zsums):
+                            executor.shutdown(cancel_futures=True)
+                            break
+            else:
+                _init_permutation_worker(*initargs)
+                for batch in batches:
+                    if store(batch, _run_permutations(batch)):
+                        break
+    n = stopping_point() if any(tested.values()) else 0
+    if n < iterations:
+        logger.info(f'{name}: stopped after {n} of {iterations} permutations')
+    zsums = [completed[iteration] for iteration in range(n)]
+    results = {
+        effect: [(start, end, zsum,
+                  sum(zsum > permutation[effect] for permutation in zsums)
+                  / max(n, 1))
+                 for start, end, zsum in clusters]
+        for effect, clusters in cluster_obs.items()}
+    FOLDER_RESULTS.mkdir(exist_ok=True)
+    (FOLDER_RESULTS / f'{name}.json').write_text(json.dumps({
+        'formula': formula, 'groups': groups, 'winlen': winlen,
+        'iterations': iterations, 'permutations': n, 'seed': seed,
+        'clusters': {effect: [{'start': start, 'end': end, 'zsum': zsum,
+                               'p': 1 - hits}
+                              for start, end, zsum, hits in clusters]
+                     for effect, clusters in results.items()}
+    }, indent=1))
+    return results
+
+
 def annotate_clusters(clusters, y=-5e-6):
     for xmin, xmax, zsum, hits in clusters:
         p = 1 - hits
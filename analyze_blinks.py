@@ -12,7 +12,8 @@ from datamatrix import operations as ops
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=['subject_nr', 'eog', 'erg', 'erg_upper',
+                              'erg_lower', 'has_blink'])
 fdm = dm.field == 'full'
 
 
@@ -11,7 +11,7 @@ from statsmodels.formula.api import mixedlm
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=GAZE_KINEMATICS_COLUMNS)
 print(f'before blink removal: {len(dm)}')
 dm = (dm.blink_latency < 0) | (dm.blink_latency > .5)
 print(f'after blink removal: {len(dm)}')
@@ -26,31 +26,38 @@ import seaborn as sns
 import analysis_utils
 analysis_utils.N_PUPIL_BINS = 10
 add_bin_pupil(fdm)
-fdm.gaze_x = srs.smooth(fdm.gaze_x, winlen=11)
-fdm.gaze_y = srs.smooth(fdm.gaze_y, winlen=11)
-fdm.gaze_vel = ((fdm.gaze_x[1:, :150] - fdm.gaze_x[:-1, :150]) ** 2
-                + (fdm.gaze_y[1:, :150] - fdm.gaze_y[:-1, :150]) ** 2) ** .5
-fdm.mean_gaze_vel = fdm.gaze_vel[:, ...]
+# The gaze kinematics are stored in the merged data if GAZE_KINEMATICS is
+# enabled, and otherwise computed from the gaze data
+if any(name not in fdm for name in GAZE_KINEMATICS_COLUMNS):
+    gdm = get_merged_data(columns=['gaze_x', 'gaze_y'])
+    gdm = (gdm.blink_latency < 0) | (gdm.blink_latency > .5)
+    gdm = gdm.field == 'full'
+    for name, value in gaze_kinematics(gdm.gaze_x, gdm.gaze_y).items():
+        fdm[name] = value
 gdm = fdm[:]
 gdm = gdm.mean_gaze_vel != np.nan
-gdm = gdm.mean_gaze_vel < 200
+# Exclude the 1% of trials with the highest velocity. This replaces the
+# fixed cutoff of 200, which was tuned to earlier velocities that were
+# mistakenly computed between consecutive trials rather than consecutive
+# samples. This changes the meaning of panel c of gaze-velocity.svg: it now
+# excludes a different set of trials, and velocities are in units/s.
+gdm = gdm.mean_gaze_vel < np.nanpercentile(
+    np.asarray(gdm.mean_gaze_vel, dtype=float), 99)
 plt.figure(figsize=(6, 10))
 plt.subplots_adjust(hspace=.4)
 plt.subplot(311)
 plt.title('a) Histogram of per-trial mean gaze velocity')
 sns.distplot(list(gdm.mean_gaze_vel), kde=False)
-plt.xlabel('Gaze velocity (arbitrary units)')
+plt.xlabel('Gaze velocity (units/s)')
 plt.subplot(312)
 plt.title('b) Gaze velocity as a function of pupil size (all data)')
 sns.pointplot(data=fdm, y='mean_gaze_vel', x='bin_pupil')
-plt.ylabel('Gaze velocity (arbitrary units)')
+plt.ylabel('Gaze velocity (units/s)')
 plt.xlabel('Pupil size (bin)')
-plt.ylim(25, 100)
 plt.subplot(313)
-plt.title('c) Gaze velocity as a function of pupil size (gaze velocity < 200)')
+plt.title('c) Gaze velocity as a function of pupil size (without outliers)')
 sns.pointplot(data=gdm, y='mean_gaze_vel', x='bin_pupil')
-plt.ylabel('Gaze velocity (arbitrary units)')
+plt.ylabel('Gaze velocity (units/s)')
 plt.xlabel('Pupil size (bin)')
-plt.ylim(25, 100)
 plt.savefig(FOLDER_SVG / 'gaze-velocity.svg')
 plt.show()
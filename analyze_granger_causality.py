@@ -2,7 +2,6 @@
 Imports
 """
 from analysis_utils import *
-from statsmodels.tsa.stattools import grangercausalitytests
 from matplotlib import pyplot as plt
 from scipy.stats import ttest_rel
 
@@ -10,7 +9,7 @@ from scipy.stats import ttest_rel
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=['subject_nr', 'erg', 'erp_occipital'])
 dm, fdm = filter_dm(dm)
 
 
@@ -21,31 +20,13 @@ First perform the analysis
 """
 minlag = 10
 maxlag = 30
-erg_first = []
-erp_first = []
-for subject_nr, sdm in ops.split(fdm.subject_nr):
-    print(subject_nr)
-    x1 = np.diff(sdm.erp_occipital.mean)
-    x2 = np.diff(sdm.erg.mean)
-    data = np.array([x1, x2]).T
-    f = []
-    results = grangercausalitytests(data, maxlag=np.arange(minlag, maxlag, 1),
-                                    verbose=False)
-    for lag, result in results.items():
-        fvalue = result[0]['params_ftest'][0]
-        f.append(fvalue)
-    erg_first.append(f)
-    data = np.array([x2, x1]).T
-    f = []
-    results = grangercausalitytests(data, maxlag=np.arange(minlag, maxlag, 1),
-                                    verbose=False)
-    f = []
-    for lag, result in results.items():
-        fvalue = result[0]['params_ftest'][0]
-        f.append(fvalue)
-    erp_first.append(f)
-erg_first = np.array(erg_first)
-erp_first = np.array(erp_first)
+mdm = group_aggregate(fdm, ['subject_nr'], erg=('erg', 'mean'),
+                      erp_occipital=('erp_occipital', 'mean'))
+x1 = np.diff(mdm.erp_occipital._seq, axis=1)
+x2 = np.diff(mdm.erg._seq, axis=1)
+# erg_first: does the ERG Granger-cause the occipital ERP? erp_first: vice
+# versa
+erg_first, erp_first = granger_ftests(x1, x2, range(minlag, maxlag))
    
 
 """
@@ -64,3 +45,32 @@ plt.savefig(FOLDER_SVG / 'granger-causality.svg')
 plt.show()
 ttest = ttest_rel(erg_first, erp_first)
 print(ttest.pvalue)
+
+
+"""
+# Single-trial Granger causality
+
+The same analysis, but based on the single trials rather than on the average
+signals of each participant. For each participant, the lagged regressions
+are fit to all trials together.
+"""
+codes, keys = group_codes(fdm.subject_nr)
+trial_x1 = np.diff(fdm.erp_occipital._seq, axis=1)
+trial_x2 = np.diff(fdm.erg._seq, axis=1)
+trial_erg_first, trial_erp_first = trial_granger_ftests(
+    trial_x1, trial_x2, codes, range(minlag, maxlag))
+plt.figure(figsize=(6, 3))
+plt.plot(trial_erg_first.T, ':', color='green')
+plt.plot(trial_erg_first.mean(axis=0), color='green',
+         label='ERG to occipital ERP')
+plt.plot(trial_erp_first.T, ':', color='red')
+plt.plot(trial_erp_first.mean(axis=0), color='red',
+         label='Occipital ERP to ERG')
+plt.xticks(np.arange(0, maxlag - minlag, 5), np.arange(minlag, maxlag, 5))
+plt.ylabel('Granger causality')
+plt.xlabel('Lag (ms)')
+plt.legend(title='Direction')
+plt.savefig(FOLDER_SVG / 'granger-causality-single-trial.svg')
+plt.show()
+ttest = ttest_rel(trial_erg_first, trial_erp_first)
+print(ttest.pvalue)
@@ -11,23 +11,17 @@ from datamatrix import SeriesColumn, operations as ops
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=[
+    'subject_nr', 'session_nr', 'count_trial_sequence', 'intensity_cdm2',
+    'mean_pupil_area', 'pupil_slope', 'erg', 'erp_occipital'])
 dm, fdm = filter_dm(dm)
 
 
 """
 Add carry-over data
 """
-idm = DataMatrix()
-fdm.previous_intensity_cdm2 = 0
-fdm.trial_diff = 0
-for subject_nr, session_nr, sdm in ops.split(fdm.subject_nr, fdm.session_nr):
-    print(len(sdm))
-    sdm.previous_intensity_cdm2[1:] = sdm.intensity_cdm2[:-1]
-    sdm.trial_diff[1:] = sdm.count_trial_sequence[1:] - sdm.count_trial_sequence[:-1]
-    sdm = sdm.trial_diff == 1
-    idm <<= sdm
-fdm = idm
+mask = add_lag_features(fdm, previous_intensity_cdm2='intensity_cdm2')
+fdm = fdm[np.flatnonzero(mask).tolist()]
 
 """
 # Effects of intensity of previous trial
@@ -57,9 +51,8 @@ fdm.erp100 = fdm.erp_occipital[:, EEG_OFFSET:]
 fdm.z_int = ops.z(fdm.previous_intensity_cdm2)
 fdm.z_pup = ops.z(fdm.mean_pupil_area)
 fdm.z_slo = ops.z(fdm.pupil_slope)
-results_erg = tst.lmer_permutation_test(fdm,
-    'erg100 ~ z_int + z_pup + z_slo',
-    groups='subject_nr', winlen=2, suppress_convergence_warnings=True)
+results_erg = permutation_test(fdm,
+    'erg100 ~ z_int + z_pup + z_slo', 'intertrial-erg', winlen=2)
 print(results_erg)
 # Output
 # {'Intercept': [(40, 86, 376.88145322108613, 0.999),
@@ -11,7 +11,9 @@ from datamatrix import SeriesColumn
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=[
+    'intensity_cdm2', 'pupil', 'pupil_dilation', 'eog_tfr', 'erg', 'erg_upper',
+    'erg_lower', 'laterg', 'erp_occipital', 'laterp_occipital'])
 dm, fdm = filter_dm(dm)
 
 """
@@ -0,0 +1,72 @@
+"""
+Imports
+"""
+from analysis_utils import *
+import time_series_test as tst
+
+
+"""
+# Load data
+
+The same data is loaded once with double precision and once with single
+precision for the columns in FLOAT32_COLUMNS.
+"""
+columns = ['subject_nr', 'session_nr', 'eog', 'erp_occipital', 'pupil',
+           'intensity_cdm2', 'mean_pupil_area', 'pupil_slope']
+dm64 = get_merged_data(columns=columns, precision='float64')
+dm64, fdm64 = filter_dm(dm64)
+dm32 = get_merged_data(columns=columns, precision='float32')
+dm32, fdm32 = filter_dm(dm32)
+
+
+"""
+# Derived measures
+
+The derived measures are recomputed from the single-precision columns and
+compared to the same measures computed from the double-precision columns.
+"""
+def derived_measures(dm):
+    dm.z_erg = 0
+    for subject_nr, session_nr, sdm in ops.split(dm.subject_nr,
+                                                 dm.session_nr):
+        dm.z_erg[sdm] = ops.z(sdm.eog[:, ...][:, 115:140][:, ...])
+    return {
+        'z_erg': dm.z_erg,
+        'erg': dm.eog[:, ...]._seq,
+        'erp_occipital': dm.erp_occipital._seq,
+        'mean_pupil': dm.pupil[:, 0:150][:, ...],
+    }
+
+
+measures64 = derived_measures(fdm64)
+measures32 = derived_measures(fdm32)
+for name in measures64:
+    deviation = np.nanmax(np.abs(np.asarray(measures64[name], dtype=float)
+                                 - np.asarray(measures32[name], dtype=float)))
+    print(f'{name}: max. absolute deviation = {deviation:.3g}')
+
+
+"""
+# Cluster statistics
+
+The sample-by-sample statistics and the resulting clusters are compared for
+the main ERP model. The clusters are the input for the permutation tests.
+"""
+def cluster_stats(fdm):
+    fdm.erp100 = fdm.erp_occipital[:, EEG_OFFSET:]
+    fdm.z_int = ops.z(fdm.intensity_cdm2)
+    fdm.z_pup = ops.z(fdm.mean_pupil_area)
+    fdm.z_slo = ops.z(fdm.pupil_slope)
+    rm = fast_lmer_series(fdm, 'erp100 ~ z_int + z_pup + z_slo',
+                          groups='subject_nr', winlen=2)
+    return rm, tst._clusters(rm, .05)
+
+
+rm64, clusters64 = cluster_stats(fdm64)
+rm32, clusters32 = cluster_stats(fdm32)
+print(f'z: max. absolute deviation = '
+      f'{np.nanmax(np.abs(rm64.z._seq - rm32.z._seq)):.3g}')
+for effect in clusters64:
+    print(effect)
+    print(f'- float64: {clusters64[effect]}')
+    print(f'- float32: {clusters32[effect]}')
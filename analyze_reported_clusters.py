@@ -0,0 +1,173 @@
+"""
+Imports
+"""
+from analysis_utils import *
+import time_series_test as tst
+import warnings
+
+
+"""
+# Reported results
+
+The clusters and hit proportions of the cluster-based permutation tests as
+reported in analyze_stats.py, which were obtained with
+tst.lmer_permutation_test() and 1000 permutations.
+"""
+REPORTED = {
+    'stats-erg': ('erg100 ~ z_int + z_pup + z_slo', {
+        'z_int': [(94, 151, 588.644491911626, 1.0),
+                  (38, 64, 242.5394210652641, 0.998),
+                  (12, 36, 212.02132303969242, 0.997),
+                  (68, 88, 113.98986841669849, 0.975)],
+        'z_pup': [(64, 151, 526.3421609758193, 1.0),
+                  (36, 56, 66.31554008492043, 0.967)],
+        'z_slo': [(16, 151, 606.7320941314092, 1.0)]}),
+    'stats-erp': ('erp100 ~ z_int + z_pup + z_slo', {
+        'z_int': [(116, 151, 183.47360047954274, 0.999),
+                  (24, 64, 171.89639861702193, 0.999),
+                  (68, 88, 118.39609350450344, 0.995),
+                  (94, 100, 12.794898805235192, 0.653)],
+        'z_pup': [(132, 146, 30.562503478100183, 0.906),
+                  (76, 90, 28.62322826418741, 0.9)],
+        'z_slo': []}),
+    'stats-erg-interactions': ('erg100 ~ z_int * z_pup * z_slo', {
+        'z_int': [(94, 151, 580.1808887707748, 1.0),
+                  (38, 64, 244.67405421088569, 0.999),
+                  (12, 36, 209.24801813853804, 0.996),
+                  (68, 88, 110.43147590359217, 0.973)],
+        'z_pup': [(64, 151, 519.9292187555513, 1.0),
+                  (36, 56, 67.29018085622731, 0.966)],
+        'z_int:z_pup': [(44, 70, 80.78833597009395, 0.989),
+                        (130, 148, 47.380979809094, 0.96),
+                        (14, 20, 12.615279427974727, 0.82)],
+        'z_slo': [(16, 151, 599.8106694003424, 1.0)],
+        'z_int:z_slo': [(104, 122, 42.1026230884066, 0.826),
+                        (90, 100, 21.261422997971188, 0.675),
+                        (36, 46, 21.082034251404938, 0.671),
+                        (0, 2, 3.9664122892792624, 0.575)],
+        'z_pup:z_slo': [(70, 106, 88.47418794714277, 0.972)],
+        'z_int:z_pup:z_slo': [(150, 151, 2.1256313702740393, 0.712)]}),
+    'stats-erp-interactions': ('erp100 ~ z_int * z_pup * z_slo', {
+        'z_int': [(116, 151, 173.53457025784408, 1.0),
+                  (26, 64, 171.27259671111142, 1.0),
+                  (68, 88, 117.67999465131382, 0.998),
+                  (94, 102, 17.682482919225603, 0.711)],
+        'z_pup': [(132, 148, 34.9193462948077, 0.916),
+                  (76, 92, 33.81194973667516, 0.91)],
+        'z_int:z_pup': [(40, 68, 84.5655241173102, 0.985),
+                        (128, 151, 76.46321319906427, 0.975),
+                        (78, 92, 47.36793157430726, 0.929),
+                        (98, 110, 31.869626161348783, 0.872)],
+        'z_slo': [],
+        'z_int:z_slo': [(102, 118, 39.46734167180677, 0.827),
+                        (78, 92, 33.939941242832525, 0.781)],
+        'z_pup:z_slo': [],
+        'z_int:z_pup:z_slo': [(128, 150, 60.60719182129, 0.947)]}),
+}
+REPORTED_ITERATIONS = 1000
+# The maximum relative difference in zsum for a cluster to count as
+# reproduced
+ZSUM_TOLERANCE = .01
+
+
+"""
+# Load data
+
+As in analyze_stats.py
+"""
+dm = get_merged_data(columns=['subject_nr', 'mean_pupil_area', 'pupil_slope',
+                              'intensity_cdm2', 'erg', 'erp_occipital'])
+dm, fdm = filter_dm(dm)
+fdm.erg100 = fdm.erg[:, EEG_OFFSET:]
+fdm.erp100 = fdm.erp_occipital[:, EEG_OFFSET:]
+fdm.z_int = ops.z(fdm.intensity_cdm2)
+fdm.z_pup = ops.z(fdm.mean_pupil_area)
+fdm.z_slo = ops.z(fdm.pupil_slope)
+
+
+"""
+# Observed clusters
+
+permutation_test() determines the observed clusters with fast_lmer_series(),
+whereas the reported clusters were determined with tst.lmer_series(). Both are
+compared to the reported clusters. At samples where statsmodels didn't
+converge, the z values of the two differ, which can move the edges of a
+cluster.
+"""
+def find_cluster(clusters, start, end):
+    for cluster in clusters:
+        if cluster[:2] == (start, end):
+            return cluster
+    return None
+
+
+def matches(cluster, zsum):
+    return cluster is not None \
+        and abs(cluster[2] - zsum) <= ZSUM_TOLERANCE * zsum
+
+
+reproduced = True
+for name, (formula, reported) in REPORTED.items():
+    print(f'{name}: {formula}')
+    rm_fast = fast_lmer_series(fdm, formula, groups='subject_nr', winlen=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        rm_tst = tst.lmer_series(fdm, formula, groups='subject_nr', winlen=2)
+    z_fast = {row.effect: row.z for row in rm_fast}
+    deviation = max(np.nanmax(np.abs(z_fast[row.effect] - row.z))
+                    for row in rm_tst)
+    print(f'- max. absolute z difference with tst.lmer_series(): '
+          f'{deviation:.3g}')
+    clusters_fast = tst._clusters(rm_fast, .05)
+    clusters_tst = tst._clusters(rm_tst, .05)
+    for effect, clusters in reported.items():
+        for start, end, zsum, hits in clusters:
+            fast = find_cluster(clusters_fast[effect], start, end)
+            slow = find_cluster(clusters_tst[effect], start, end)
+            reproduced &= matches(fast, zsum)
+            print(f'- {effect} {start}-{end} (zsum = {zsum:.2f}): '
+                  f'fast_lmer_series() {matches(fast, zsum)}, '
+                  f'tst.lmer_series() {matches(slow, zsum)}')
+        # Clusters that were not reported
+        for start, end, zsum in clusters_fast[effect]:
+            if find_cluster(clusters, start, end) is None:
+                reproduced = False
+                print(f'- {effect} {start}-{end} (zsum = {zsum:.2f}): '
+                      f'not reported')
+print(f'All reported clusters reproduced: {reproduced}')
+
+
+"""
+# Hit proportions
+
+permutation_test() shuffles only the predictors, with a seeded random
+generator, whereas tst.lmer_permutation_test() also shuffles the dependent
+variable with an unseeded random generator. The permutation distribution is
+the same, but the hit proportions are not identical. They should differ by no
+more than is expected from the limited number of permutations.
+"""
+for name, (formula, reported) in REPORTED.items():
+    path = FOLDER_RESULTS / f'{name}.json'
+    if not path.exists():
+        print(f'{name}: no results, run analyze_stats.py first')
+        continue
+    results = json.loads(path.read_text())
+    n = results['permutations']
+    print(f'{name}: {n} permutations')
+    for effect, clusters in reported.items():
+        for start, end, zsum, hits in clusters:
+            result = find_cluster(
+                [(cluster['start'], cluster['end'], cluster['p'])
+                 for cluster in results['clusters'][effect]], start, end)
+            if result is None:
+                print(f'- {effect} {start}-{end}: cluster not found')
+                continue
+            p_reported, p = 1 - hits, result[2]
+            # The standard error of the difference between both estimates,
+            # with the p-value bounded away from 0 and 1
+            p_mean = np.clip((p_reported + p) / 2, 1 / n, 1 - 1 / n)
+            se = np.sqrt(p_mean * (1 - p_mean)
+                         * (1 / REPORTED_ITERATIONS + 1 / n))
+            print(f'- {effect} {start}-{end}: p = {p:.3f} '
+                  f'(reported {p_reported:.3f}, '
+                  f'within 3 SE: {abs(p - p_reported) <= 3 * se})')
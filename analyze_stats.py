@@ -13,7 +13,10 @@ import seaborn as sns
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=[
+    'subject_nr', 'intensity', 'intensity_cdm2', 'influx_adjustment',
+    'mean_pupil_area', 'pupil_slope', 'pupil_dilation', 'erg',
+    'erp_occipital'])
 dm, fdm = filter_dm(dm)
 
 
@@ -31,12 +34,8 @@ fdm.z_slo = ops.z(fdm.pupil_slope)
 """
 Determine peak erg45 index separately for each participant and intensity level
 """
-fdm.erg25_index = 0
-fdm.erg25_peak = 0
-for subject_nr, intensity, sdm in ops.split(fdm.subject_nr, fdm.intensity):
-   erg25_index = np.argmin(sdm.erg.mean[ERG_PEAK_RANGE[0]:ERG_PEAK_RANGE[1]]) + ERG_PEAK_RANGE[0]
-   fdm.erg25_index[sdm] = erg25_index
-   fdm.erg25_peak[sdm] = sdm.erg[:, erg25_index - 2:erg25_index + 3][:, ...]
+codes, keys = group_codes(fdm.subject_nr, fdm.intensity)
+fdm.erg25_index, fdm.erg25_peak = erg_peaks(fdm.erg, codes)
 
    
 """
@@ -106,7 +105,7 @@ print(model.aic)
 """
 Perform a sample-by-sample analysis for visualization.
 """
-result = tst.lmer_series(fdm,
+result = fast_lmer_series(fdm,
     'erg100 ~ z_int + z_pup + z_slo',
     groups='subject_nr', winlen=2)
 for row in result[1:]:
@@ -116,7 +115,7 @@ plt.axhline(1.96, color='black', linestyle=':')
 plt.axhline(-1.96, color='black', linestyle=':')
 plt.legend()
 plt.show()
-result = tst.lmer_series(fdm,
+result = fast_lmer_series(fdm,
     'erp100 ~ z_int + z_pup + z_slo',
     groups='subject_nr', winlen=2)
 for row in result[1:]:
@@ -134,11 +133,14 @@ initially a hint of variability being affected by pupil size, this effect
 disappeared after a slightly different preprocessing (due to compensating for
 the photodiode). This may have been spurious or is very weak, and as such we
 leave it for now.
+
+The '# Output' blocks are the reported results, which were obtained with
+tst.lmer_permutation_test() and 1000 permutations. The results of
+permutation_test() are written to results/.
 """
 import logging; logging.basicConfig(level=logging.INFO, force=True)
-results_erg = tst.lmer_permutation_test(fdm,
-    'erg100 ~ z_int + z_pup + z_slo',
-    groups='subject_nr', winlen=2, suppress_convergence_warnings=True)
+results_erg = permutation_test(fdm,
+    'erg100 ~ z_int + z_pup + z_slo', 'stats-erg', winlen=2)
 print(results_erg)
 # Output
 # {'Intercept': [(40, 84, 344.018221404389, 1.0),
@@ -152,9 +154,8 @@ print(results_erg)
 #   (36, 56, 66.31554008492043, 0.967)],
 #  'z_slo': [(16, 151, 606.7320941314092, 1.0)]}
 
-results_erp = tst.lmer_permutation_test(fdm,
-    'erp100 ~ z_int + z_pup + z_slo',
-    groups='subject_nr', winlen=2, suppress_convergence_warnings=True)
+results_erp = permutation_test(fdm,
+    'erp100 ~ z_int + z_pup + z_slo', 'stats-erp', winlen=2)
 print(results_erp)
 # Output
 # {'Intercept': [(86, 151, 303.28993020140734, 0.374),
@@ -171,9 +172,8 @@ print(results_erp)
 """
 Statistical analyses with interaction terms
 """
-results_erg = tst.lmer_permutation_test(fdm,
-    'erg100 ~ z_int * z_pup * z_slo',
-    groups='subject_nr', winlen=2, suppress_convergence_warnings=True)
+results_erg = permutation_test(fdm,
+    'erg100 ~ z_int * z_pup * z_slo', 'stats-erg-interactions', winlen=2)
 print(results_erg)
 # Output
 # {'Intercept': [(40, 84, 343.2766228810468, 0.996),
@@ -196,9 +196,8 @@ print(results_erg)
 #  'z_pup:z_slo': [(70, 106, 88.47418794714277, 0.972)],
 #  'z_int:z_pup:z_slo': [(150, 151, 2.1256313702740393, 0.712)]}
 
-results_erp = tst.lmer_permutation_test(fdm,
-    'erp100 ~ z_int * z_pup * z_slo',
-    groups='subject_nr', winlen=2, suppress_convergence_warnings=True)
+results_erp = permutation_test(fdm,
+    'erp100 ~ z_int * z_pup * z_slo', 'stats-erp-interactions', winlen=2)
 print(results_erp)
 # Output
 # {'Intercept': [(86, 151, 303.4408530726622, 0.436),
@@ -2,14 +2,13 @@
 Imports
 """
 from analysis_utils import *
-from mne.channels import layout
 from matplotlib import pyplot as plt
 
 
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=['erp', 'eog'])
 dm, fdm = filter_dm(dm, del_erp=False)
 
 
@@ -18,8 +17,7 @@ dm, fdm = filter_dm(dm, del_erp=False)
 
 For each 20 ms time window, create a topographical map
 """
-raw, events, metadata = read_subject(SUBJECTS[0])
-erp_pos = layout._find_topomap_coords(raw.info, 'eeg')
+erp_pos = eeg_topomap_coords()
 eog_pos = np.array([
     [-.05, .105],  # VEOGT top
     [-.05, .11],   # HEOGL bottom
@@ -29,16 +27,7 @@ eog_pos = np.array([
 pos = np.concatenate([erp_pos, eog_pos])
 dt = 10
 times = np.arange(0, 121, dt)
-data = np.zeros([len(times), fdm.erp.shape[1] + fdm.eog.shape[1]])
-for i, t in enumerate(times):
-    erp = np.concatenate([
-        fdm.erp[:,:,EEG_OFFSET + t:EEG_OFFSET + t + dt][..., :, ...],
-        fdm.eog[:,:,EEG_OFFSET + t:EEG_OFFSET + t + dt][..., :, ...]])
-    data[i] = erp
-for i, t in enumerate(times):
-    ax = plt.gca()
-    plt.title(f'Time {t} - {t + dt} ms')
-    mne.viz.plot_topomap(data[i], pos, size=4, vlim=(data.min(), data.max()),
-                         axes=ax, show=False)
-    plt.savefig(FOLDER_TOPOMAPS / f'topomap-{t}.svg')
-    plt.show()
+data = window_averages([fdm.erp, fdm.eog], EEG_OFFSET + times, dt)
+render_topomaps(data, pos,
+                paths=[FOLDER_TOPOMAPS / f'topomap-{t}.svg' for t in times],
+                titles=[f'Time {t} - {t + dt} ms' for t in times])
@@ -11,7 +11,9 @@ from datamatrix import SeriesColumn, DataMatrix
 """
 # Load data
 """
-dm = get_merged_data()
+dm = get_merged_data(columns=[
+    'subject_nr', 'intensity', 'pupil_dilation', 'erg_nobaseline',
+    'erp_occipital_nobaseline'])
 dm, fdm = filter_dm(dm)
 
 
@@ -21,20 +23,12 @@ dm, fdm = filter_dm(dm)
 For each combination of subject, intensity, and pupil size bin, the standard 
 deviation of the ERG and ERP signals is stored as a new series column.
 """
-vdm_bin_pupil = DataMatrix(length=fdm.intensity.count * fdm.bin_pupil.count 
-                 * fdm.subject_nr.count)
-vdm_bin_pupil.erg_std = SeriesColumn(depth=fdm.erg.depth - EEG_OFFSET)
-vdm_bin_pupil.erp_std = SeriesColumn(depth=fdm.erp_occipital.depth - EEG_OFFSET)
+vdm_bin_pupil = group_aggregate(fdm, ['intensity', 'bin_pupil', 'subject_nr'],
+    erg_std=(fdm.erg_nobaseline[:, EEG_OFFSET:], 'std'),
+    erp_std=(fdm.erp_occipital_nobaseline[:, EEG_OFFSET:], 'std'))
 # vdm_bin_pupil.gaze_std = SeriesColumn(depth=fdm.gaze_vel.depth)
-for row, (intensity, bin_pupil, subject_nr, sdm) in zip(vdm_bin_pupil,
-      ops.split(fdm.intensity, fdm.bin_pupil, fdm.subject_nr)):
-   row.intensity = intensity
-   row.bin_pupil = bin_pupil
-   row.subject_nr = subject_nr
-   row.erg_std = sdm.erg_nobaseline.std[EEG_OFFSET:]
-   row.erp_std = sdm.erp_occipital_nobaseline.std[EEG_OFFSET:]
-   
-   
+
+
 plt.figure(figsize=FIGSIZE)
 plt.subplot(211)
 plt.title(f'a) Full field ERG')
@@ -61,21 +55,12 @@ plt.show()
 """
 As above, but then separate for pupil dilation and constriction
 """
-vdm_pupil_dilation = DataMatrix(length=fdm.intensity.count 
-                                * fdm.pupil_dilation.count
-                                * fdm.subject_nr.count)
-vdm_pupil_dilation.erg_std = SeriesColumn(depth=fdm.erg.depth - EEG_OFFSET)
-vdm_pupil_dilation.erp_std = SeriesColumn(depth=fdm.erp_occipital.depth - EEG_OFFSET)
-for row, (intensity, pupil_dilation, subject_nr, sdm) in zip(
-      vdm_pupil_dilation,
-      ops.split(fdm.intensity, fdm.pupil_dilation, fdm.subject_nr)):
-   row.intensity = intensity
-   row.pupil_dilation = pupil_dilation
-   row.subject_nr = subject_nr
-   row.erg_std = sdm.erg_nobaseline.std[EEG_OFFSET:]
-   row.erp_std = sdm.erp_occipital_nobaseline.std[EEG_OFFSET:]
-   
-   
+vdm_pupil_dilation = group_aggregate(fdm,
+    ['intensity', 'pupil_dilation', 'subject_nr'],
+    erg_std=(fdm.erg_nobaseline[:, EEG_OFFSET:], 'std'),
+    erp_std=(fdm.erp_occipital_nobaseline[:, EEG_OFFSET:], 'std'))
+
+
 plt.figure(figsize=FIGSIZE)
 plt.subplot(211)
 plt.title(f'a) Full field ERG')
@@ -100,38 +85,36 @@ plt.show()
 # Statistics
 
 Use cluster-based permutation test to analyze the effect of binned pupil size
-and stimulus intensity on the variability of the ERG and ERP signals.
+and stimulus intensity on the variability of the ERG and ERP signals. The
+'# Output' blocks are the reported results, which were obtained with
+tst.lmer_permutation_test() and 1000 permutations.
 """
-result_erg_bin_pupil = tst.lmer_permutation_test(vdm_bin_pupil,
-   'erg_std ~ bin_pupil + intensity', groups='subject_nr',
-   suppress_convergence_warnings=True)
+result_erg_bin_pupil = permutation_test(vdm_bin_pupil,
+   'erg_std ~ bin_pupil + intensity', 'variability-erg-bin-pupil')
 print(result_erg_bin_pupil)
 # Output
 # {'Intercept': [(0, 151, 1415.4855411207257, 0.0)],
 #  'bin_pupil': [],
 #  'intensity': []}
 
-result_erp_bin_pupil = tst.lmer_permutation_test(vdm_bin_pupil,
-   'erp_std ~ bin_pupil + intensity', groups='subject_nr',
-   suppress_convergence_warnings=True)
+result_erp_bin_pupil = permutation_test(vdm_bin_pupil,
+   'erp_std ~ bin_pupil + intensity', 'variability-erp-bin-pupil')
 print(result_erp_bin_pupil)
 # Output
 # {'Intercept': [(0, 151, 1931.1045173217194, 0.147)],
 #  'bin_pupil': [(0, 1, 1.9674423369775385, 0.702)],
 #  'intensity': []}
 
-result_erg_pupil_dilation = tst.lmer_permutation_test(vdm_pupil_dilation,
-   'erg_std ~ pupil_dilation + intensity', groups='subject_nr',
-   suppress_convergence_warnings=True)
+result_erg_pupil_dilation = permutation_test(vdm_pupil_dilation,
+   'erg_std ~ pupil_dilation + intensity', 'variability-erg-pupil-dilation')
 print(result_erg_pupil_dilation)
 # Output
 # {'Intercept': [(0, 151, 1468.0597455728664, 0.0)],
 #  'pupil_dilation[T.Dilating]': [],
 #  'intensity': []}
 
-result_erp_pupil_dilation = tst.lmer_permutation_test(vdm_pupil_dilation,
-   'erp_std ~ pupil_dilation + intensity', groups='subject_nr',
-   suppress_convergence_warnings=True)
+result_erp_pupil_dilation = permutation_test(vdm_pupil_dilation,
+   'erp_std ~ pupil_dilation + intensity', 'variability-erp-pupil-dilation')
 print(result_erp_pupil_dilation)
 # Output
 # {'Intercept': [(0, 151, 1917.8152932990054, 0.0)],
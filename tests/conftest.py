@@ -0,0 +1,7 @@
+"""
+The tests import analysis_utils from the folder with the analysis scripts.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
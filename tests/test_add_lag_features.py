@@ -0,0 +1,61 @@
+"""
+Tests for add_lag_features()
+"""
+import numpy as np
+from datamatrix import DataMatrix, operations as ops
+from analysis_utils import add_lag_features
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=300)
+    dm.subject_nr = np.repeat([1, 2, 3], 100)
+    dm.session_nr = np.tile(np.repeat([1, 2], 50), 3)
+    dm.count_trial_sequence = np.tile(np.arange(50), 6)
+    dm.intensity_cdm2 = rng.choice([1., 2., 4.], 300)
+    dm.mean_pupil_area = rng.normal(size=300)
+    # Remove some trials, as filter_dm() does
+    return dm[np.flatnonzero(rng.random(300) > .2).tolist()]
+
+
+def test_matches_split():
+    dm = _test_dm()
+    mask = add_lag_features(dm, previous_intensity_cdm2='intensity_cdm2',
+                            previous_pupil='mean_pupil_area')
+    idm = dm[np.flatnonzero(mask).tolist()]
+    # The loop that add_lag_features() replaces in analyze_intertrial.py
+    edm = DataMatrix()
+    dm.previous_intensity_cdm2 = 0
+    dm.trial_diff = 0
+    for subject_nr, session_nr, sdm in ops.split(dm.subject_nr,
+                                                 dm.session_nr):
+        sdm.previous_intensity_cdm2[1:] = sdm.intensity_cdm2[:-1]
+        sdm.trial_diff[1:] = sdm.count_trial_sequence[1:] \
+            - sdm.count_trial_sequence[:-1]
+        sdm = sdm.trial_diff == 1
+        edm <<= sdm
+    assert len(idm) == len(edm)
+    idm = ops.sort(idm, by=idm.count_trial_sequence)
+    idm = ops.sort(idm, by=idm.session_nr)
+    idm = ops.sort(idm, by=idm.subject_nr)
+    for name in ('subject_nr', 'session_nr', 'count_trial_sequence',
+                 'previous_intensity_cdm2', 'trial_diff'):
+        np.testing.assert_array_equal(np.asarray(idm[name], dtype=float),
+                                      np.asarray(edm[name], dtype=float))
+
+
+def test_n_back():
+    dm = _test_dm()
+    mask = add_lag_features(dm, n_back=2, previous_pupil='mean_pupil_area')
+    seq = np.asarray(dm.count_trial_sequence)
+    session = np.asarray(dm.subject_nr) * 10 + np.asarray(dm.session_nr)
+    pupil = np.asarray(dm.mean_pupil_area)
+    for i in range(len(dm)):
+        earlier = np.flatnonzero((session == session[i]) & (seq < seq[i]))
+        if len(earlier) < 2:
+            assert np.isnan(dm.previous_pupil[i])
+            assert not mask[i]
+            continue
+        j = earlier[np.argsort(seq[earlier])[-2]]
+        assert dm.previous_pupil[i] == pupil[j]
+        assert mask[i] == (seq[i] - seq[j] == 2)
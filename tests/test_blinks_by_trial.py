@@ -0,0 +1,39 @@
+"""
+Tests for blinks_by_trial()
+"""
+import mne
+import numpy as np
+from analysis_utils import blinks_by_trial
+
+
+def _blinks_by_trial(annotations, n_trials, trigger='1', blink='BLINK'):
+    """A straightforward implementation that loops through trials."""
+    stim_onset = [a['onset'] for a in annotations
+                  if a['description'] == trigger]
+    latency, count, duration = [], [], []
+    for i, onset in enumerate(stim_onset):
+        end = stim_onset[i + 1] if i + 1 < len(stim_onset) else np.inf
+        blinks = [a for a in annotations if a['description'] == blink
+                  and onset <= a['onset'] < end]
+        latency.append(blinks[0]['onset'] - onset if blinks else -1)
+        count.append(len(blinks))
+        duration.append(sum(a['duration'] for a in blinks))
+    return np.array(latency), np.array(count), np.array(duration)
+
+
+def test_matches_loop():
+    rng = np.random.default_rng(0)
+    stim_onset = np.arange(1, 101) * 2.
+    blink_onset = np.sort(rng.uniform(0, 205, 60))
+    # A blink that starts exactly at a stimulus trigger
+    blink_onset[10] = stim_onset[20]
+    onset = np.r_[stim_onset, blink_onset, rng.uniform(0, 205, 20)]
+    description = ['1'] * len(stim_onset) + ['BLINK'] * len(blink_onset) \
+        + ['BAD_muscle'] * 20
+    annotations = mne.Annotations(onset, rng.uniform(.05, .3, len(onset)),
+                                  description)
+    result = blinks_by_trial(annotations, len(stim_onset))
+    expected = _blinks_by_trial(annotations, len(stim_onset))
+    for r, e in zip(result, expected):
+        np.testing.assert_allclose(r, e, atol=1e-12)
+    assert result[0][20] == 0
@@ -0,0 +1,106 @@
+"""
+Tests for the channel information that is stored alongside the checkpoint
+"""
+import shutil
+import numpy as np
+import mne
+import pytest
+from datamatrix import DataMatrix, MultiDimensionalColumn
+import analysis_utils
+from analysis_utils import read_channel_info, eeg_topomap_coords, \
+    get_merged_data
+
+
+def _test_info():
+    info = mne.create_info(['Fz', 'Cz', 'Pz', 'O1', 'Oz', 'O2', 'VEOGB',
+                            'HEOGL', 'PupilSize'], 1000.,
+                           ['eeg'] * 6 + ['eog'] * 2 + ['misc'])
+    info.set_montage('standard_1020', on_missing='ignore')
+    return info
+
+
+def test_read_channel_info(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'CHANNEL_INFO_PATH',
+                        tmp_path / 'checkpoint-channels.json')
+    info = _test_info()
+    calls = []
+
+    def read_subject(subject_nr):
+        calls.append(subject_nr)
+        raw = mne.io.RawArray(np.zeros((len(info.ch_names), 10)), info)
+        return raw, None, None
+
+    monkeypatch.setattr(analysis_utils, 'read_subject', read_subject)
+    # Without stored channel information, the first subject is read once
+    channel_info = read_channel_info()
+    assert read_channel_info() == channel_info
+    assert calls == [analysis_utils.SUBJECTS[0]]
+    assert channel_info['sfreq'] == 1000
+    assert channel_info['columns'] == {
+        'erp': ['Fz', 'Cz', 'Pz', 'O1', 'Oz', 'O2'],
+        'eog': ['VEOGB', 'HEOGL']}
+    assert [channel['type'] for channel in channel_info['channels']] == \
+        ['eeg'] * 6 + ['eog'] * 2 + ['misc']
+    np.testing.assert_allclose(
+        eeg_topomap_coords(),
+        mne.channels.layout._find_topomap_coords(info, picks='eeg'))
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    """Creates a merged checkpoint of simulated sessions, and returns the
+    channel information of these sessions.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analysis_utils, 'SUBJECTS', [31, 32])
+    monkeypatch.setattr(analysis_utils, 'N_PROCESSES', 1)
+    monkeypatch.setattr(analysis_utils, 'TFR_Z_SCOPE', 'session')
+    for subject_nr in analysis_utils.SUBJECTS:
+        path = tmp_path / 'data' / f'sub-{subject_nr}' / 'eeg'
+        path.mkdir(parents=True)
+        (path / 'raw.bin').write_text(str(subject_nr))
+    info = _test_info()
+
+    def get_subject_data(subject_nr, n_jobs=-1):
+        dm = DataMatrix(length=3)
+        dm.subject_nr = subject_nr
+        for name in ('z_erg', 'z_pupil', 'z_pupil_slope'):
+            dm[name] = 0
+        dm.mean_pupil = 1
+        dm.intensity = -1
+        dm.blink_latency = -1
+        dm.erp = MultiDimensionalColumn(shape=(info.ch_names[:6], 5),
+                                        metadata=info)
+        return dm, None
+
+    def read_subject(subject_nr):
+        raise FileNotFoundError('the raw data is not read')
+
+    monkeypatch.setattr(analysis_utils, 'get_subject_data', get_subject_data)
+    monkeypatch.setattr(analysis_utils, 'read_subject', read_subject)
+    assert len(get_merged_data()) == 6
+    return read_channel_info()
+
+
+def test_restored_from_session(checkpoint, monkeypatch):
+    # A checkpoint from before channel information was stored with it. The
+    # channel information is then taken from the first session, without
+    # reading the session data.
+    (analysis_utils.CHECKPOINT_FOLDER / analysis_utils.CHECKPOINT
+     / 'channels.json').unlink()
+    analysis_utils.CHANNEL_INFO_PATH.unlink()
+    monkeypatch.setattr(analysis_utils.io, 'readbin', None)
+    assert len(get_merged_data()) == 6
+    assert read_channel_info() == checkpoint
+
+
+def test_restored_from_checkpoint(checkpoint, tmp_path):
+    # Only the checkpoint has been downloaded
+    shutil.rmtree(tmp_path / 'data')
+    shutil.rmtree(analysis_utils.SESSION_CACHE_FOLDER)
+    analysis_utils.CHANNEL_INFO_PATH.unlink()
+    assert len(get_merged_data()) == 6
+    assert read_channel_info() == checkpoint
+    np.testing.assert_allclose(
+        eeg_topomap_coords(),
+        mne.channels.layout._find_topomap_coords(_test_info(), picks='eeg'))
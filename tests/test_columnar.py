@@ -0,0 +1,79 @@
+"""
+Tests for the columnar checkpoint format of write_columnar() and
+read_columnar()
+"""
+import json
+import numpy as np
+from datamatrix import DataMatrix, MultiDimensionalColumn, SeriesColumn, \
+    FloatColumn, IntColumn
+from analysis_utils import write_columnar, read_columnar, read_columnar_key
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=5)
+    dm.subject_nr = IntColumn
+    dm.subject_nr = [1, 1, 2, 2, 3]
+    dm.pupil = FloatColumn
+    dm.pupil = rng.normal(size=5)
+    dm.pupil[2] = np.nan
+    dm.field = ['full', 'full', 'center', 'periphery', 'full']
+    dm.mixed = [1, 'a', 2.5, None, np.int64(3)]
+    dm.erg = SeriesColumn(depth=10)
+    dm.erg = rng.normal(size=(5, 10))
+    dm.tfr = MultiDimensionalColumn(shape=(2, 3, 4))
+    dm.tfr = rng.normal(size=(5, 2, 3, 4))
+    dm.erp = MultiDimensionalColumn(shape=(['O1', 'O2'], 4))
+    dm.erp = rng.normal(size=(5, 2, 4))
+    return dm
+
+
+def test_round_trip(tmp_path):
+    dm = _test_dm()
+    write_columnar(dm, tmp_path / 'merged', key='abc')
+    rdm = read_columnar(tmp_path / 'merged')
+    assert rdm.column_names == dm.column_names
+    assert len(rdm) == len(dm)
+    assert isinstance(rdm.subject_nr, IntColumn)
+    assert isinstance(rdm.pupil, FloatColumn)
+    for name in ('subject_nr', 'pupil', 'erg', 'tfr', 'erp'):
+        np.testing.assert_array_equal(rdm[name]._seq, dm[name]._seq)
+    assert list(rdm.field) == list(dm.field)
+    assert list(rdm.mixed) == [1, 'a', 2.5, None, 3]
+    assert rdm.erp.index_names[0] == ['O1', 'O2']
+    assert rdm.erp[:, 'O2'].shape == (5, 4)
+
+
+def test_memory_mapped_columns_are_not_written_back(tmp_path):
+    write_columnar(_test_dm(), tmp_path / 'merged')
+    rdm = read_columnar(tmp_path / 'merged')
+    assert isinstance(rdm.erg._seq, np.memmap)
+    rdm.erg._seq[:] = 0
+    np.testing.assert_array_equal(read_columnar(tmp_path / 'merged').erg._seq,
+                                  _test_dm().erg._seq)
+
+
+def test_column_selection(tmp_path):
+    write_columnar(_test_dm(), tmp_path / 'merged')
+    rdm = read_columnar(tmp_path / 'merged',
+                        columns=['pupil', 'erg', 'nonexistent'])
+    assert rdm.column_names == ['erg', 'pupil']
+    assert len(rdm) == 5
+
+
+def test_key(tmp_path):
+    assert read_columnar_key(tmp_path / 'merged') is None
+    write_columnar(_test_dm(), tmp_path / 'merged', key='abc')
+    assert read_columnar_key(tmp_path / 'merged') == 'abc'
+    # Overwriting replaces the existing data
+    write_columnar(_test_dm()[:2], tmp_path / 'merged', key='def')
+    assert read_columnar_key(tmp_path / 'merged') == 'def'
+    assert len(read_columnar(tmp_path / 'merged')) == 2
+
+
+def test_channel_info(tmp_path):
+    channel_info = {'sfreq': 1000., 'columns': {'erp': ['O1', 'O2']}}
+    write_columnar(_test_dm(), tmp_path / 'merged', channel_info=channel_info)
+    assert json.loads((tmp_path / 'merged' / 'channels.json').read_text()) \
+        == channel_info
+    assert 'channels' not in read_columnar(tmp_path / 'merged')
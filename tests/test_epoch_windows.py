@@ -0,0 +1,44 @@
+"""
+Tests for _epoch_windows()
+"""
+import numpy as np
+import mne
+import analysis_utils
+from analysis_utils import _epoch_windows
+
+
+def _test_raw():
+    rng = np.random.default_rng(0)
+    info = mne.create_info(['O1', 'Oz', 'VEOGB', 'PupilSize'], 1000.,
+                           ['eeg', 'eeg', 'eog', 'misc'])
+    raw = mne.io.RawArray(rng.normal(size=(4, 60000)), info, first_samp=300)
+    raw.set_annotations(mne.Annotations(
+        [5.05, 12.2, 30.6, 40.], [.1, .3, .2, .5],
+        ['BAD_muscle', 'BLINK', 'bad_x', 'BAD_edge']))
+    # The first and last events are so close to the edges of the recording
+    # that only the shorter window fits
+    samples = np.r_[400, np.arange(2000, 59000, 1000), 60100]
+    events = np.c_[samples, np.zeros_like(samples), np.ones_like(samples)]
+    return raw, events
+
+
+def test_matches_epochs(monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'EPOCH_CHUNK_SIZE', 7)
+    raw, events = _test_raw()
+    windows = [(['O1', 'Oz'], -.05, .1), (['VEOGB', 'PupilSize'], -.5, 1.)]
+    items, data = zip(*_epoch_windows(raw, events, windows))
+    np.testing.assert_array_equal(np.concatenate(items),
+                                  np.arange(len(events)))
+    for i, (picks, tmin, tmax) in enumerate(windows):
+        window = np.concatenate([d[i] for d in data])
+        epochs = mne.Epochs(raw, events, tmin=tmin, tmax=tmax, picks=picks,
+                            baseline=None, reject_by_annotation=True,
+                            preload=True)
+        kept = np.array([not log for log in epochs.drop_log])
+        assert window.shape[-1] == len(epochs.times)
+        np.testing.assert_allclose(window[kept], epochs.get_data(),
+                                   rtol=1e-12)
+        assert np.isnan(window[~kept]).all()
+        assert (~kept).any()
+        # Epochs at the edges are nan only for the window that doesn't fit
+        assert kept[0] == kept[-1] == (i == 0)
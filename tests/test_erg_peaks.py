@@ -0,0 +1,49 @@
+"""
+Tests for group_codes() and erg_peaks()
+"""
+import numpy as np
+from datamatrix import DataMatrix, SeriesColumn, operations as ops
+from analysis_utils import group_codes, erg_peaks, ERG_PEAK_RANGE
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=600)
+    dm.subject_nr = rng.integers(1, 6, 600)
+    dm.intensity = rng.choice([75, 150, 300], 600)
+    dm.erg = SeriesColumn(depth=250)
+    dm.erg = rng.normal(size=(600, 250))
+    dm.erg[:50] = np.nan
+    dm.erg[rng.random(600) < .1, 130] = np.nan
+    return dm
+
+
+def test_group_codes():
+    dm = _test_dm()
+    codes, keys = group_codes(dm.subject_nr, dm.intensity)
+    # Groups are numbered in the order of ops.split()
+    for code, (subject_nr, intensity, sdm) in enumerate(
+            ops.split(dm.subject_nr, dm.intensity)):
+        assert keys[code] == (subject_nr, intensity)
+        np.testing.assert_array_equal(np.flatnonzero(codes == code),
+                                      np.asarray(sdm._rowid))
+
+
+def test_erg_peaks():
+    dm = _test_dm()
+    codes, _ = group_codes(dm.subject_nr, dm.intensity)
+    index, peak = erg_peaks(dm.erg, codes)
+    # The loop that erg_peaks() replaces in analyze_stats.py
+    dm.erg25_index = 0
+    dm.erg25_peak = 0
+    for subject_nr, intensity, sdm in ops.split(dm.subject_nr,
+                                                dm.intensity):
+        erg25_index = np.argmin(
+            sdm.erg.mean[ERG_PEAK_RANGE[0]:ERG_PEAK_RANGE[1]]) \
+            + ERG_PEAK_RANGE[0]
+        dm.erg25_index[sdm] = erg25_index
+        dm.erg25_peak[sdm] = sdm.erg[:, erg25_index - 2:erg25_index + 3][
+            :, ...]
+    np.testing.assert_array_equal(index, dm.erg25_index)
+    np.testing.assert_allclose(peak, np.asarray(dm.erg25_peak, dtype=float),
+                               rtol=1e-12)
@@ -0,0 +1,48 @@
+"""
+Tests for fast_lmer_series()
+"""
+import warnings
+import numpy as np
+import time_series_test as tst
+from datamatrix import DataMatrix, SeriesColumn
+from analysis_utils import fast_lmer_series
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=300)
+    dm.subject_nr = np.repeat(np.arange(10), 30)
+    dm.x1 = rng.normal(size=300)
+    dm.x2 = rng.normal(size=300)
+    dm.y = SeriesColumn(depth=6)
+    dm.y = rng.normal(size=(300, 6)) \
+        + np.linspace(0, 1, 6) * np.asarray(dm.x1)[:, None] \
+        + rng.normal(size=10)[np.asarray(dm.subject_nr, dtype=int),
+                              None]
+    dm.y[5:20, 2] = np.nan
+    return dm
+
+
+def test_matches_lmer_series():
+    dm = _test_dm()
+    rm = fast_lmer_series(dm, 'y ~ x1 * x2', groups='subject_nr')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = tst.lmer_series(dm, 'y ~ x1 * x2', groups='subject_nr')
+    assert list(rm.effect) == list(expected.effect)
+    for row, expected_row in zip(rm, expected):
+        for name in ('est', 'se', 'z', 'p'):
+            np.testing.assert_allclose(row[name], expected_row[name],
+                                       rtol=1e-3, atol=1e-4)
+
+
+def test_winlen():
+    dm = _test_dm()
+    rm = fast_lmer_series(dm, 'y ~ x1', groups='subject_nr', winlen=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = tst.lmer_series(dm, 'y ~ x1', groups='subject_nr',
+                                   winlen=2)
+    for row, expected_row in zip(rm, expected):
+        np.testing.assert_allclose(row.z, expected_row.z, rtol=1e-3,
+                                   atol=1e-4)
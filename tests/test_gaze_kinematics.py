@@ -0,0 +1,58 @@
+"""
+Tests for gaze_kinematics()
+"""
+import numpy as np
+from datamatrix import DataMatrix, SeriesColumn, series as srs
+from analysis_utils import gaze_kinematics
+
+
+def _test_dm(n_trials=120, depth=300):
+    """Returns random-walk gaze with one microsaccade in every other trial.
+    """
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.normal(scale=.01, size=(n_trials, depth)), axis=1)
+    y = np.cumsum(rng.normal(scale=.01, size=(n_trials, depth)), axis=1)
+    # Microsaccades of 15 ms with a constant velocity
+    for i in range(0, n_trials, 2):
+        start = rng.integers(20, 120)
+        ramp = np.clip((np.arange(depth) - start) / 15, 0, 1)
+        x[i] += ramp * 1.5
+        y[i] -= ramp
+    dm = DataMatrix(length=n_trials)
+    dm.gaze_x = SeriesColumn(depth=depth)
+    dm.gaze_x = x
+    dm.gaze_y = SeriesColumn(depth=depth)
+    dm.gaze_y = y
+    dm.gaze_x[-1] = np.nan
+    dm.gaze_y[-1] = np.nan
+    return dm
+
+
+def test_velocity_and_acceleration():
+    dm = _test_dm()
+    results = gaze_kinematics(dm.gaze_x, dm.gaze_y, chunk_size=50)
+    # Smoothing the full series, as analyze_gaze_velocity.py did before
+    x = np.asarray(srs.smooth(dm.gaze_x, winlen=11)._seq)[:, :150]
+    y = np.asarray(srs.smooth(dm.gaze_y, winlen=11)._seq)[:, :150]
+    dx, dy = np.diff(x, axis=1), np.diff(y, axis=1)
+    np.testing.assert_allclose(results['mean_gaze_vel'],
+                               np.mean(np.hypot(dx, dy), axis=1) * 1000,
+                               rtol=1e-10)
+    np.testing.assert_allclose(
+        results['mean_gaze_acc'],
+        np.mean(np.hypot(np.diff(dx, axis=1), np.diff(dy, axis=1)),
+                axis=1) * 1000 ** 2,
+        rtol=1e-10)
+
+
+def test_microsaccades_and_drift():
+    dm = _test_dm()
+    results = gaze_kinematics(dm.gaze_x, dm.gaze_y)
+    count = results['microsaccade_count']
+    np.testing.assert_array_equal(count[:-1], np.arange(119) % 2 == 0)
+    # Drift excludes the displacement due to microsaccades, which is much
+    # larger than the displacement due to the random walk
+    assert np.all(results['drift_amplitude'][:-1] < 1)
+    # Trials without data
+    for values in results.values():
+        assert np.isnan(values[-1])
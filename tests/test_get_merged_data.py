@@ -0,0 +1,144 @@
+"""
+Tests for get_merged_data() with simulated sessions
+"""
+import shutil
+import sys
+import numpy as np
+import mne
+import pytest
+from datamatrix import DataMatrix, MultiDimensionalColumn, SeriesColumn, io
+import analysis_utils
+from analysis_utils import get_merged_data
+
+SUBJECTS = [31, 32, 41]
+
+
+def _subject_data(subject_nr):
+    """Returns simulated data of a single session."""
+    rng = np.random.default_rng(subject_nr)
+    info = mne.create_info(['O1', 'Oz', 'O2'], 1000., 'eeg')
+    info.set_montage('standard_1020')
+    dm = DataMatrix(length=4)
+    dm.subject_nr = subject_nr
+    for name in ('z_erg', 'z_pupil', 'z_pupil_slope'):
+        dm[name] = 0
+    dm.mean_pupil = rng.uniform(2, 4, 4)
+    dm.intensity = -1
+    dm.blink_latency = -1
+    dm.field = 'full'
+    dm.training = 'no'
+    dm.erg = SeriesColumn(depth=10)
+    dm.erg = rng.normal(size=(4, 10))
+    dm.erp = MultiDimensionalColumn(shape=(info.ch_names, 10), metadata=info)
+    dm.erp = rng.normal(size=(4, 3, 10))
+    return dm
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    """Creates raw data files and replaces preprocessing by simulated
+    sessions. Returns a list of processed sessions.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analysis_utils, 'SUBJECTS', SUBJECTS)
+    monkeypatch.setattr(analysis_utils, 'N_PROCESSES', 1)
+    monkeypatch.setattr(analysis_utils, 'TFR_Z_SCOPE', 'session')
+    for subject_nr in SUBJECTS:
+        path = tmp_path / 'data' / f'sub-{subject_nr}' / 'eeg'
+        path.mkdir(parents=True)
+        (path / 'raw.bin').write_text(str(subject_nr))
+    calls = []
+
+    def get_subject_data(subject_nr, n_jobs=-1):
+        calls.append(subject_nr)
+        return _subject_data(subject_nr), None
+
+    monkeypatch.setattr(analysis_utils, 'get_subject_data', get_subject_data)
+    return calls
+
+
+def test_session_cache(sessions, tmp_path):
+    dm = get_merged_data()
+    assert list(dm.subject_nr) == [31] * 4 + [32] * 4 + [41] * 4
+    assert sessions == SUBJECTS
+    # The merged checkpoint is reused as long as nothing changes
+    np.testing.assert_array_equal(get_merged_data().erg._seq, dm.erg._seq)
+    assert sessions == SUBJECTS
+    # Only sessions with changed raw data are processed again
+    (tmp_path / 'data' / 'sub-32' / 'eeg' / 'raw.bin').write_text('changed')
+    np.testing.assert_array_equal(get_merged_data().erg._seq, dm.erg._seq)
+    assert sessions == SUBJECTS + [32]
+
+
+def test_settings_change(sessions, monkeypatch):
+    get_merged_data()
+    monkeypatch.setattr(analysis_utils, 'PREPROCESSING_VERSION',
+                        analysis_utils.PREPROCESSING_VERSION + 1)
+    get_merged_data()
+    assert sessions == SUBJECTS + SUBJECTS
+
+
+def test_parallel(sessions, tmp_path, monkeypatch):
+    dm = get_merged_data()
+    # Processing sessions in parallel gives the same result, in the order of
+    # SUBJECTS
+    shutil.rmtree(tmp_path / 'checkpoints')
+    monkeypatch.setattr(analysis_utils, 'N_PROCESSES', 2)
+    pdm = get_merged_data()
+    assert list(pdm.subject_nr) == list(dm.subject_nr)
+    np.testing.assert_array_equal(pdm.erg._seq, dm.erg._seq)
+
+
+def test_columns(sessions):
+    dm = get_merged_data()
+    sdm = get_merged_data(columns=['erg', 'nonexistent'])
+    # The columns that filter_dm() depends on are always loaded
+    assert set(sdm.column_names) == {'erg'} | {
+        name for name in analysis_utils.FILTER_COLUMNS if name in dm}
+    np.testing.assert_array_equal(sdm.erg._seq, dm.erg._seq)
+
+
+def test_precision(sessions, tmp_path):
+    dm = get_merged_data()
+    sdm = get_merged_data(precision='float32')
+    assert sdm.erp._seq.dtype == np.float32
+    assert sdm.erg._seq.dtype == np.float64
+    np.testing.assert_array_equal(sdm.erp._seq, dm.erp._seq.astype(np.float32))
+    # Each precision has a separate checkpoint
+    assert get_merged_data().erp._seq.dtype == np.float64
+    assert (tmp_path / 'checkpoints'
+            / f'{analysis_utils.CHECKPOINT}-float32').exists()
+    with pytest.raises(ValueError):
+        get_merged_data(precision='float16')
+    # Without the raw data, the single-precision data is derived from the
+    # double-precision checkpoint
+    shutil.rmtree(tmp_path / 'data')
+    shutil.rmtree(tmp_path / 'checkpoints'
+                  / f'{analysis_utils.CHECKPOINT}-float32')
+    np.testing.assert_array_equal(
+        get_merged_data(precision='float32').erp._seq, sdm.erp._seq)
+
+
+def test_limit_memory_without_resource(monkeypatch):
+    # The resource module doesn't exist on Windows
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    analysis_utils._limit_memory(2 ** 40)
+
+
+def test_legacy_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dm = _subject_data(31)
+    legacy_path = tmp_path / 'checkpoints' / f'{analysis_utils.CHECKPOINT}.dm'
+    legacy_path.parent.mkdir()
+    io.writebin(dm, legacy_path)
+    sdm = get_merged_data(columns=['erg'])
+    np.testing.assert_array_equal(sdm.erg._seq, dm.erg._seq)
+    # The legacy checkpoint is converted once, after which only the requested
+    # columns are read from the columnar checkpoint
+    legacy_path.unlink()
+    sdm = get_merged_data(columns=['erp'])
+    assert isinstance(sdm.erp._seq, np.memmap)
+    assert 'erg' not in sdm
+    np.testing.assert_array_equal(sdm.erp._seq, dm.erp._seq)
+    assert analysis_utils.read_channel_info()['columns']['erp'] == \
+        ['O1', 'Oz', 'O2']
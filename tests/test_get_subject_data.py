@@ -0,0 +1,83 @@
+"""
+Tests for get_subject_data() with a simulated recording
+"""
+import numpy as np
+import pandas as pd
+import mne
+import pytest
+import analysis_utils
+from analysis_utils import get_subject_data, EEG_EPOCH, PUPIL_EPOCH, \
+    STIMULUS_TRIGGER_ADJUSTMENT
+
+CH_NAMES = ['O1', 'Oz', 'O2', 'Fz', 'VEOGB', 'VEOGT', 'HEOGL', 'HEOGR',
+            'PupilSize', 'GazeX', 'GazeY']
+CH_TYPES = ['eeg'] * 4 + ['eog'] * 4 + ['misc'] * 3
+
+
+def _read_subject(subject_nr):
+    """Returns a simulated recording as returned by read_subject()."""
+    rng = np.random.default_rng(0)
+    info = mne.create_info(CH_NAMES, 1000., CH_TYPES)
+    data = rng.normal(size=(len(CH_NAMES), 60000)) * 1e-5
+    data[8] = rng.normal(1000, 50, 60000)
+    data[9:] = np.cumsum(rng.normal(size=(2, 60000)), axis=1)
+    raw = mne.io.RawArray(data, info, first_samp=500)
+    raw.set_annotations(mne.Annotations(
+        [5.5, 12.1, 20.52], [.1, .3, .01], ['BAD_muscle', 'BLINK', 'BAD_x']))
+    samples = np.arange(1000, 59000, 1500) + 500
+    events = np.c_[samples, np.zeros_like(samples), np.ones_like(samples)]
+    metadata = pd.DataFrame({'subject_nr': subject_nr,
+                             'trial': np.arange(len(events))})
+    return raw, (events, {'1': 1}), metadata
+
+
+@pytest.fixture
+def subject_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'read_subject', _read_subject)
+    monkeypatch.setattr(analysis_utils, 'TFR_CACHE_FOLDER', tmp_path)
+    monkeypatch.setattr(analysis_utils, 'TFR_Z_SCOPE', 'session')
+    sdm, stats = get_subject_data(31, n_jobs=1)
+    return sdm
+
+
+def _epochs(picks, tmin, tmax, baseline):
+    """Epochs the simulated recording with mne.Epochs() and returns the data
+    with nan values for rejected epochs.
+    """
+    raw, (events, _), _ = _read_subject(31)
+    events[:, 0] += STIMULUS_TRIGGER_ADJUSTMENT
+    epochs = mne.Epochs(raw, events, tmin=tmin, tmax=tmax, picks=picks,
+                        baseline=baseline, reject_by_annotation=True,
+                        preload=True)
+    kept = np.array([not log for log in epochs.drop_log])
+    data = np.full((len(events), len(picks), len(epochs.times)), np.nan)
+    data[kept] = epochs.get_data()
+    return data
+
+
+def test_epochs(subject_data):
+    sdm = subject_data
+    np.testing.assert_allclose(
+        sdm.erp._seq, _epochs(CH_NAMES[:4], *EEG_EPOCH, (None, 0)),
+        rtol=1e-10)
+    np.testing.assert_allclose(
+        sdm.eog_nobaseline._seq, _epochs(CH_NAMES[4:8], *EEG_EPOCH, None),
+        rtol=1e-10)
+    np.testing.assert_allclose(
+        sdm.gaze_x._seq, _epochs(['GazeX'], *PUPIL_EPOCH, None)[:, 0],
+        rtol=1e-10)
+    # Some epochs are rejected because of bad annotations
+    assert np.isnan(sdm.erp._seq).any(axis=(1, 2)).sum() > 0
+
+
+
+def test_gaze_kinematics(subject_data, monkeypatch):
+    sdm = subject_data
+    results = analysis_utils.gaze_kinematics(sdm.gaze_x, sdm.gaze_y)
+    for name in analysis_utils.GAZE_KINEMATICS_COLUMNS:
+        np.testing.assert_array_equal(sdm[name], results[name])
+    # The kinematics are optional
+    monkeypatch.setattr(analysis_utils, 'GAZE_KINEMATICS', False)
+    sdm, stats = get_subject_data(31, n_jobs=1)
+    assert not any(name in sdm
+                   for name in analysis_utils.GAZE_KINEMATICS_COLUMNS)
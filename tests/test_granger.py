@@ -0,0 +1,91 @@
+"""
+Tests for granger_ftest(), granger_ftests(), and trial_granger_ftests()
+"""
+import numpy as np
+from statsmodels.tsa.stattools import grangercausalitytests
+from analysis_utils import granger_ftest, granger_ftests, trial_granger_ftests
+
+
+def _test_signals(n_signals, n_samples, seed=0):
+    """Returns signals where x2 Granger-causes x1."""
+    rng = np.random.default_rng(seed)
+    x2 = rng.normal(size=(n_signals, n_samples))
+    x1 = rng.normal(size=(n_signals, n_samples))
+    x1[:, 3:] += .5 * x2[:, :-3]
+    return x1, x2
+
+
+def _ftest(effect, cause, lags):
+    """Returns the F statistics of grangercausalitytests()."""
+    results = grangercausalitytests(np.stack([effect, cause], axis=1), lags)
+    return np.array([results[lag][0]['params_ftest'][0] for lag in lags])
+
+
+def test_matches_statsmodels():
+    x1, x2 = _test_signals(3, 150)
+    lags = [1, 2, 5]
+    f = granger_ftest(x1, x2, lags)
+    assert f.shape == (3, 3)
+    for i in range(3):
+        np.testing.assert_allclose(f[i], _ftest(x1[i], x2[i], lags),
+                                   rtol=1e-8)
+    np.testing.assert_allclose(granger_ftest(x1[0], x2[0], lags), f[0],
+                               rtol=1e-12)
+
+
+def test_both_directions():
+    x1, x2 = _test_signals(5, 150)
+    lags = [1, 3]
+    for n_jobs in (1, 2):
+        x2_to_x1, x1_to_x2 = granger_ftests(x1, x2, lags, n_jobs=n_jobs)
+        np.testing.assert_allclose(x2_to_x1, granger_ftest(x1, x2, lags),
+                                   rtol=1e-12)
+        np.testing.assert_allclose(x1_to_x2, granger_ftest(x2, x1, lags),
+                                   rtol=1e-12)
+    # The effect of x2 on x1 at lag 3
+    assert np.all(x2_to_x1[:, 1] > x1_to_x2[:, 1])
+
+
+def _lagged(x, lag):
+    """Returns the lags of each row of x as a design matrix, such that lags
+    don't cross the boundaries between rows.
+    """
+    return np.concatenate([np.stack([row[lag - k:len(row) - k]
+                                     for k in range(1, lag + 1)], axis=1)
+                           for row in x])
+
+
+def _trial_ftest(effect, cause, lag):
+    """Fits the lagged regressions to all trials with lstsq()."""
+    y = np.concatenate([row[lag:] for row in effect])
+    const = np.ones((len(y), 1))
+    X_own = np.concatenate([_lagged(effect, lag), const], axis=1)
+    X_joint = np.concatenate([_lagged(effect, lag), _lagged(cause, lag),
+                              const], axis=1)
+    ssr_own = np.linalg.lstsq(X_own, y, rcond=None)[1][0]
+    ssr_joint = np.linalg.lstsq(X_joint, y, rcond=None)[1][0]
+    return (ssr_own - ssr_joint) / ssr_joint / lag \
+        * (len(y) - X_joint.shape[1])
+
+
+def test_trial_granger_ftests():
+    x1, x2 = _test_signals(60, 40)
+    x1[[3, 17], 5] = np.nan
+    codes = np.repeat([0, 1, 2], 20)
+    lags = [1, 4]
+    for n_jobs in (1, 2):
+        x2_to_x1, x1_to_x2 = trial_granger_ftests(x1, x2, codes, lags,
+                                                  chunk_size=7,
+                                                  n_jobs=n_jobs)
+        assert x2_to_x1.shape == (3, 2)
+        for code in range(3):
+            # Trials with nan values are skipped
+            rows = np.flatnonzero((codes == code)
+                                  & ~np.isnan(x1).any(axis=1))
+            for i, lag in enumerate(lags):
+                np.testing.assert_allclose(
+                    x2_to_x1[code, i], _trial_ftest(x1[rows], x2[rows], lag),
+                    rtol=1e-8)
+                np.testing.assert_allclose(
+                    x1_to_x2[code, i], _trial_ftest(x2[rows], x1[rows], lag),
+                    rtol=1e-8)
@@ -0,0 +1,55 @@
+"""
+Tests for group_aggregate()
+"""
+import numpy as np
+import pytest
+from datamatrix import DataMatrix, SeriesColumn, FloatColumn, \
+    operations as ops
+from analysis_utils import group_aggregate
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=500)
+    dm.subject_nr = rng.integers(1, 6, 500)
+    dm.field = rng.choice(['full', 'center', 'periphery'], 500)
+    pupil = rng.normal(size=500)
+    pupil[rng.random(500) < .1] = np.nan
+    erg = rng.normal(size=(500, 20))
+    erg[rng.random(500) < .1, 5] = np.nan
+    # A group with a single trial and a group with only nan values
+    dm.subject_nr[0] = 10
+    dm.subject_nr[1:3] = 11
+    pupil[1:3] = np.nan
+    dm.pupil = FloatColumn
+    dm.pupil = pupil
+    dm.erg = SeriesColumn(depth=20)
+    dm.erg = erg
+    return dm
+
+
+def test_matches_split():
+    dm = _test_dm()
+    rdm = group_aggregate(dm, ['subject_nr', 'field'],
+                          pupil_mean=('pupil', 'mean'),
+                          pupil_std=('pupil', 'std'),
+                          pupil_sum=('pupil', 'sum'),
+                          pupil_count=('pupil', 'count'),
+                          erg_mean=('erg', 'mean'),
+                          erg_std=(dm.erg, 'std'))
+    groups = list(ops.split(dm.subject_nr, dm.field))
+    assert len(rdm) == len(groups)
+    for row, (subject_nr, field, sdm) in zip(rdm, groups):
+        assert (row.subject_nr, row.field) == (subject_nr, field)
+        pupil = np.asarray(sdm.pupil, dtype=float)
+        np.testing.assert_allclose(row.pupil_mean, sdm.pupil.mean)
+        np.testing.assert_allclose(row.pupil_std, sdm.pupil.std)
+        np.testing.assert_allclose(row.pupil_sum, np.nansum(pupil))
+        assert row.pupil_count == np.sum(~np.isnan(pupil))
+        np.testing.assert_allclose(row.erg_mean, sdm.erg.mean)
+        np.testing.assert_allclose(row.erg_std, sdm.erg.std)
+
+
+def test_invalid_function():
+    with pytest.raises(ValueError):
+        group_aggregate(_test_dm(), ['subject_nr'], x=('pupil', 'median'))
@@ -0,0 +1,26 @@
+"""
+Tests for linregress_rows()
+"""
+import numpy as np
+from scipy.stats import linregress
+from analysis_utils import linregress_rows
+
+
+def test_matches_linregress():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1.5, 50)
+    y = rng.normal(size=(20, 50)) + rng.normal(size=(20, 1)) * x
+    y[3] = 2
+    y[5, 10] = np.nan
+    slope, intercept, rvalue = linregress_rows(x, y)
+    for i, row in enumerate(y):
+        result = linregress(x, row)
+        np.testing.assert_allclose(slope[i], result.slope, atol=1e-12)
+        np.testing.assert_allclose(intercept[i], result.intercept,
+                                   atol=1e-12)
+        # Recent versions of scipy give nan rather than 0 for rows without
+        # variance, which are therefore checked separately
+        if i != 3:
+            np.testing.assert_allclose(rvalue[i], result.rvalue, atol=1e-12)
+    assert np.isnan(slope[5])
+    assert slope[3] == 0 and intercept[3] == 2 and rvalue[3] == 0
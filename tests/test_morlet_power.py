@@ -0,0 +1,76 @@
+"""
+Tests for morlet_power() and cached_morlet_power()
+"""
+import os
+import numpy as np
+from mne.time_frequency import tfr_array_morlet
+import analysis_utils
+from analysis_utils import morlet_power, cached_morlet_power, \
+    tfr_cache_marker, prune_tfr_cache
+
+
+def _test_data():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(3, 2, 1000))
+
+
+def test_matches_tfr_array_morlet():
+    data = _test_data()
+    freqs = np.arange(4, 30, 5)
+    for decim in (1, 3):
+        power = morlet_power(data, 1000, freqs, n_cycles=2, decim=decim)
+        expected = tfr_array_morlet(data, 1000, freqs, n_cycles=2,
+                                    zero_mean=True, use_fft=True,
+                                    decim=decim, output='power')
+        np.testing.assert_allclose(power, expected, rtol=1e-9)
+
+
+def test_crop():
+    data = _test_data()
+    freqs = np.arange(4, 30, 5)
+    power = morlet_power(data, 1000, freqs, n_cycles=2, decim=2)
+    crop = np.zeros(power.shape[-1], dtype=bool)
+    crop[20:150] = True
+    np.testing.assert_allclose(
+        morlet_power(data, 1000, freqs, n_cycles=2, decim=2, crop=crop),
+        power[..., crop], rtol=1e-12)
+
+
+def test_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'TFR_CACHE_FOLDER', tmp_path)
+    data = _test_data()
+    freqs = np.arange(4, 30, 5)
+    power = morlet_power(data, 1000, freqs, n_cycles=2, decim=2)
+    crop1 = np.arange(power.shape[-1]) < 100
+    crop2 = np.arange(power.shape[-1]) >= 50
+    # Different crops of the same data share a single cache file
+    for crop in (crop1, crop2, crop1):
+        np.testing.assert_allclose(
+            cached_morlet_power(data, 1000, freqs, n_cycles=2, decim=2,
+                                crop=crop),
+            power[..., crop], rtol=1e-12)
+    assert len(list(tmp_path.glob('*.npy'))) == 1
+    cached_morlet_power(data, 1000, freqs, n_cycles=3, decim=2)
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+
+def test_prune_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'TFR_CACHE_FOLDER', tmp_path)
+    data = _test_data()
+    freqs = np.arange(4, 30, 5)
+    for n_cycles in (2, 3, 4):
+        cached_morlet_power(data, 1000, freqs, n_cycles=n_cycles, decim=2)
+    paths = {path.name: path.stat().st_mtime_ns
+             for path in tmp_path.glob('*.npy')}
+    # Make sure that the cache files are older than the marker, regardless
+    # of the resolution of the file system's timestamps
+    for path in tmp_path.glob('*.npy'):
+        os.utime(path, ns=(0, 0))
+    since = tfr_cache_marker()
+    # One cache file is used again and one is created
+    cached_morlet_power(data, 1000, freqs, n_cycles=3, decim=2)
+    cached_morlet_power(data, 1000, freqs, n_cycles=5, decim=2)
+    prune_tfr_cache(since)
+    remaining = {path.name for path in tmp_path.glob('*.npy')}
+    assert len(remaining) == 2
+    assert len(remaining & set(paths)) == 1
@@ -0,0 +1,148 @@
+"""
+Tests for permutation_test()
+"""
+import json
+import numpy as np
+import pytest
+from scipy.stats import norm
+import time_series_test as tst
+from datamatrix import DataMatrix, SeriesColumn
+import analysis_utils
+from analysis_utils import permutation_test, fast_lmer_series, \
+    _largest_clusters, _permuted_index, SEQUENTIAL_LOOKS
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_utils, 'PERMUTATION_FOLDER',
+                        tmp_path / 'permutations')
+    monkeypatch.setattr(analysis_utils, 'FOLDER_RESULTS', tmp_path / 'results')
+    monkeypatch.setattr(analysis_utils, 'PERMUTATION_BATCH_SIZE', 20)
+    return tmp_path
+
+
+def _test_dm(effect=.5):
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=200)
+    dm.subject_nr = np.repeat(np.arange(10), 20)
+    dm.x = rng.normal(size=200)
+    dm.y = SeriesColumn(depth=30)
+    signal = np.zeros(30)
+    signal[10:20] = effect
+    dm.y = rng.normal(size=(200, 30)) + signal * np.asarray(dm.x)[:, None]
+    return dm
+
+
+def _permutations(path):
+    """Returns the completed permutations as an {iteration: zsum} dict."""
+    permutations = [json.loads(line)
+                    for line in path.read_text().splitlines()[1:]]
+    return {permutation['iteration']: permutation['zsum']
+            for permutation in permutations}
+
+
+def test_resume(folders):
+    dm = _test_dm()
+    results = permutation_test(dm, 'y ~ x', 'test', iterations=100,
+                               n_jobs=1)
+    assert results['x'][0][:2] == (10, 20)
+    # Remove the last permutations and leave an incomplete line, as if the
+    # test was interrupted
+    path = folders / 'permutations' / 'test.jsonl'
+    lines = path.read_text().splitlines()
+    path.write_text('\n'.join(lines[:-30]) + '\n' + lines[-30][:10])
+    assert permutation_test(dm, 'y ~ x', 'test', iterations=100,
+                            n_jobs=1) == results
+    assert path.read_text().splitlines() == lines
+    result = json.loads((folders / 'results' / 'test.json').read_text())
+    assert result['permutations'] == 100
+
+
+def test_unreadable_header(folders):
+    dm = _test_dm()
+    results = permutation_test(dm, 'y ~ x', 'test', iterations=40, n_jobs=1)
+    path = folders / 'permutations' / 'test.jsonl'
+    lines = path.read_text().splitlines()
+    # The test was killed while the header was being written
+    for text in ('', lines[0][:20]):
+        path.write_text(text)
+        assert permutation_test(dm, 'y ~ x', 'test', iterations=40,
+                                n_jobs=1) == results
+        assert path.read_text().splitlines() == lines
+    assert not path.with_suffix('.tmp').exists()
+
+
+def test_n_jobs(folders):
+    dm = _test_dm(effect=.2)
+    results = permutation_test(dm, 'y ~ x', 'test1', iterations=60,
+                               n_jobs=1)
+    assert permutation_test(dm, 'y ~ x', 'test2', iterations=60,
+                            n_jobs=2) == results
+    # A different seed gives different permutations
+    permutation_test(dm, 'y ~ x', 'test3', iterations=60, n_jobs=1, seed=1)
+    permutations = [_permutations(folders / 'permutations' / f'{name}.jsonl')
+                    for name in ('test1', 'test2', 'test3')]
+    assert permutations[0] == permutations[1] != permutations[2]
+
+
+def test_largest_clusters():
+    rng = np.random.default_rng(0)
+    z = rng.normal(size=(8, 3, 50)) * 2
+    p = 2 * norm.sf(np.abs(z))
+    largest = _largest_clusters(z, p, .05)
+    for i in range(8):
+        rm = DataMatrix(length=3)
+        rm.effect = ['a', 'b', 'c']
+        rm.z = SeriesColumn(depth=50)
+        rm.z = z[i]
+        rm.p = SeriesColumn(depth=50)
+        rm.p = p[i]
+        for j, clusters in enumerate(tst._clusters(rm, .05).values()):
+            expected = max((zsum for start, end, zsum in clusters), default=0)
+            np.testing.assert_allclose(largest[i, j], abs(expected))
+
+
+def test_permutation_matches_lmer_series(folders):
+    dm = _test_dm()
+    permutation_test(dm, 'y ~ x', 'test', iterations=20, n_jobs=1)
+    zsums = _permutations(folders / 'permutations' / 'test.jsonl')
+    # Each permutation shuffles the predictors within subjects with a
+    # generator that is seeded by the seed and the iteration
+    group_index = [np.flatnonzero(np.asarray(dm.subject_nr) == subject_nr)
+                   for subject_nr in range(10)]
+    for iteration in (0, 13):
+        rng = np.random.default_rng([0, iteration])
+        pdm = dm[:]
+        pdm.x = np.asarray(dm.x)[_permuted_index(rng, group_index)]
+        rm = fast_lmer_series(pdm, 'y ~ x', groups='subject_nr')
+        largest = {effect: max((abs(zsum) for start, end, zsum in clusters),
+                               default=0)
+                   for effect, clusters in tst._clusters(rm, .05).items()}
+        assert zsums[iteration] == pytest.approx(largest)
+
+
+def test_sequential(folders):
+    # The p-value of a clear effect is close to zero, which cannot be
+    # resolved relative to .001 with this number of permutations, so all
+    # permutations are run
+    dm = _test_dm(effect=1)
+    results = permutation_test(dm, 'y ~ x', 'strong', iterations=200,
+                               n_jobs=1, sequential=True)
+    result = json.loads((folders / 'results' / 'strong.json').read_text())
+    assert result['permutations'] == 200
+    assert results['x'][0][3] == 1
+    # A weak effect results in a cluster that is clearly above all
+    # thresholds, so the test stops early
+    dm = _test_dm(effect=0)
+    dm.y[:, 10:13] += .15 * np.asarray(dm.x)[:, None]
+    results = permutation_test(dm, 'y ~ x', 'weak', iterations=1000,
+                               n_jobs=1, sequential=True)
+    result = json.loads((folders / 'results' / 'weak.json').read_text())
+    assert result['permutations'] < 1000
+    assert result['permutations'] in [int(round(fraction * 1000))
+                                      for fraction in SEQUENTIAL_LOOKS]
+    # The results are based on the first permutations, and therefore equal
+    # to those of a fixed test with the same number of permutations
+    assert permutation_test(dm, 'y ~ x', 'fixed',
+                            iterations=result['permutations'],
+                            n_jobs=1) == results
@@ -0,0 +1,47 @@
+"""
+Tests for topomap_interpolation() and render_topomaps()
+"""
+import numpy as np
+import mne
+from mne.viz import topomap as mne_topomap
+from analysis_utils import topomap_interpolation, render_topomaps
+
+
+def _test_pos():
+    info = mne.create_info(['Fz', 'Cz', 'Pz', 'O1', 'Oz', 'O2', 'T7', 'T8'],
+                           1000, 'eeg')
+    info.set_montage('standard_1020')
+    return mne.channels.layout._find_topomap_coords(info, picks='eeg')
+
+
+def test_interpolation_matrix():
+    pos = _test_pos()
+    data = np.random.default_rng(0).normal(size=(3, len(pos)))
+    interpolation = topomap_interpolation(pos, res=32)
+    # The interpolation that mne.viz.plot_topomap() performs for each
+    # topomap separately
+    sphere = mne_topomap._check_sphere(None)
+    outlines = mne_topomap._make_head_outlines(sphere, pos, 'head', (0., 0.))
+    extent, Xi, Yi, interp = mne_topomap._setup_interp(
+        pos, 32, 'cubic', 'head', outlines, 'mean')
+    # The gradients of the cubic interpolation are estimated iteratively,
+    # so that the interpolation is linear only up to a small tolerance
+    for values in data:
+        interp.set_values(values)
+        interp.set_locations(Xi, Yi)
+        np.testing.assert_allclose(interpolation['matrix'] @ values,
+                                   interp(), rtol=1e-5, atol=1e-6)
+
+
+def test_render_topomaps(tmp_path):
+    pos = _test_pos()
+    data = np.random.default_rng(0).normal(size=(3, len(pos)))
+    # A constant topomap has no contours
+    data[2] = 1
+    paths = [tmp_path / f'topomap-{i}.svg' for i in range(3)]
+    for n_jobs in (1, 2):
+        render_topomaps(data, pos, paths, titles=['a', 'b', 'c'],
+                        n_jobs=n_jobs)
+        assert all(path.stat().st_size > 0 for path in paths)
+        for path in paths:
+            path.unlink()
@@ -0,0 +1,44 @@
+"""
+Tests for window_averages()
+"""
+import numpy as np
+from datamatrix import DataMatrix, MultiDimensionalColumn
+from analysis_utils import window_averages
+
+
+def _test_dm():
+    rng = np.random.default_rng(0)
+    dm = DataMatrix(length=130)
+    dm.erp = MultiDimensionalColumn(shape=(4, 60))
+    dm.erp = rng.normal(size=(130, 4, 60))
+    dm.erp[:10] = np.nan
+    dm.erp[rng.random(130) < .2, 2, 17] = np.nan
+    dm.eog = MultiDimensionalColumn(shape=(2, 60))
+    dm.eog = rng.normal(size=(130, 2, 60))
+    return dm
+
+
+def test_matches_slicing():
+    dm = _test_dm()
+    offset, dt = 5, 10
+    times = np.arange(0, 51, dt)
+    data = window_averages([dm.erp, dm.eog], offset + times, dt,
+                           chunk_size=32)
+    # The loop that window_averages() replaces in analyze_topomaps.py
+    expected = np.zeros([len(times), dm.erp.shape[1] + dm.eog.shape[1]])
+    for i, t in enumerate(times):
+        expected[i] = np.concatenate([
+            dm.erp[:, :, offset + t:offset + t + dt][..., :, ...],
+            dm.eog[:, :, offset + t:offset + t + dt][..., :, ...]])
+    np.testing.assert_allclose(data, expected, rtol=1e-10)
+
+
+def test_overlapping_windows():
+    dm = _test_dm()
+    starts = np.array([0, 3, 5, 55])
+    data = window_averages([dm.eog], starts, 10)
+    seq = dm.eog._seq
+    for i, start in enumerate(starts):
+        np.testing.assert_allclose(
+            data[i], np.nanmean(seq[..., start:start + 10], axis=(0, 2)),
+            rtol=1e-10)
@@ -0,0 +1,50 @@
+"""
+Tests for freq_stats(), merge_freq_stats(), and z_by_freq()
+"""
+import numpy as np
+from datamatrix import DataMatrix, MultiDimensionalColumn
+from analysis_utils import freq_stats, merge_freq_stats, z_by_freq
+
+
+def _test_seq(n_trials, seed):
+    rng = np.random.default_rng(seed)
+    seq = rng.normal(size=(n_trials, 2, 4, 20)) \
+        * np.arange(1, 5)[:, None] + np.arange(4)[:, None]
+    seq[rng.random(seq.shape) < .05] = np.nan
+    return seq
+
+
+def _z_by_freq(seq):
+    """z-scores with nanmean() and nanstd() for each frequency separately."""
+    z = np.empty(seq.shape)
+    for i in range(seq.shape[-2]):
+        values = seq[..., i, :]
+        z[..., i, :] = (values - np.nanmean(values)) / np.nanstd(values)
+    return z
+
+
+def test_z_by_freq():
+    seq = _test_seq(250, 0)
+    dm = DataMatrix(length=len(seq))
+    dm.tfr = MultiDimensionalColumn(shape=seq.shape[1:])
+    dm.tfr._seq[:] = seq
+    z_by_freq(dm.tfr)
+    np.testing.assert_allclose(dm.tfr._seq, _z_by_freq(seq), rtol=1e-10)
+
+
+def test_merge_freq_stats():
+    seq1, seq2 = _test_seq(120, 1), _test_seq(30, 2)
+    # A frequency without data in one of the sessions
+    seq2[:, :, 2] = np.nan
+    count, mean, m2 = merge_freq_stats(freq_stats(seq1), freq_stats(seq2))
+    expected_count, expected_mean, expected_m2 = freq_stats(
+        np.concatenate([seq1, seq2]))
+    np.testing.assert_array_equal(count, expected_count)
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-10)
+    np.testing.assert_allclose(m2, expected_m2, rtol=1e-10)
+    # Stats of sessions without any data don't change the stats
+    empty = freq_stats(np.full((5, 2, 4, 20), np.nan))
+    for merged in (merge_freq_stats(empty, freq_stats(seq1)),
+                   merge_freq_stats(freq_stats(seq1), empty)):
+        for stat, expected in zip(merged, freq_stats(seq1)):
+            np.testing.assert_allclose(stat, expected, rtol=1e-12)